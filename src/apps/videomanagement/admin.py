@@ -1,16 +1,29 @@
 from django.contrib import admin
 from .models import *
 from django.contrib import admin
-from .utils.video_utils import make_video
+from .services.VideoServices import video_render_async
+from .utils.exceptions import RenderInProgressError
+
+
+class VideoStageProfileInline(admin.TabularInline):
+    model = VideoStageProfile
+    extra = 0
+    can_delete = False
+    readonly_fields = ("stage", "wall_time", "cpu_time", "peak_rss", "bytes_written", "created_at")
 
 
 class VideoAdmin(admin.ModelAdmin):
+    inlines = [VideoStageProfileInline]
+
     @admin.action
     def render_video(self, _, queryset):
         if len(queryset) > 1:
             return "You can only render 1 video per time"
 
-        make_video(queryset.first())
+        try:
+            video_render_async(queryset.first())
+        except RenderInProgressError as ex:
+            return ex.message
 
         return "Success"
     # Register the action with the model
@@ -29,3 +42,5 @@ admin.site.register(Intro)
 admin.site.register(Outro)
 admin.site.register(Backgrounds)
 admin.site.register(Avatars)
+admin.site.register(VideoRendition)
+admin.site.register(VideoStageProfile)
@@ -0,0 +1,20 @@
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from .utils.progress_utils import progress_group
+
+
+class RenderProgressConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Push the progress events of a video to the websocket client, as they are sent by the generation and render
+    stages.
+    """
+
+    async def connect(self):
+        self.group = progress_group(self.scope["url_route"]["kwargs"]["pk"])
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    async def render_progress(self, event):
+        await self.send_json(event["progress"])
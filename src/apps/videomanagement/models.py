@@ -9,11 +9,14 @@ TEMPLATE_CHOICES = (("EDUCATIONAL", "Educational"), ("GAMING", "Gaming"), ("ADVE
 
 MODEL_TYPE_CHOICES = (("API", "Api"), ("LOCAL", "Local"), ("PYTTSX3", "Pyttsx3"))
 
-VIDEO_STATUS = (("RENDERING", "RENDERING"), ("GENERATED", "GENERATED"), ("COMPLETED", "COMPLETED"))
+VIDEO_STATUS = (("RENDERING", "RENDERING"), ("GENERATED", "GENERATED"), ("COMPLETED", "COMPLETED"),
+                ("QUEUED", "QUEUED"), ("FAILED", "FAILED"))
 
 
 IMAGE_MODE = (("DALL-E", "DALL-E"), ("WEB", "WEB"))
 
+ENCODER_PROFILE_CHOICES = (("auto", "Auto"), ("standard", "Standard"), ("slides", "Slides"), ("motion", "Motion"))
+
 
 class AbstractModel(models.Model):
     created_by = models.ForeignKey(get_user_model(), on_delete = models.CASCADE, blank = True, null = True)
@@ -28,6 +31,7 @@ class TemplatePrompts(AbstractModel):
     category = models.CharField(choices = TEMPLATE_CHOICES, max_length = 20, null = True)
     format = models.TextField(blank = True)
     is_sentenced = models.BooleanField(default = False)
+    encoder_profile = models.CharField(max_length = 10, choices = ENCODER_PROFILE_CHOICES, blank = True, null = True)
     objects = models.Manager()
 
     def __str__(self):
@@ -51,6 +55,9 @@ class Music(AbstractModel):
     name = models.CharField(max_length = 140, blank = False)
     file = models.FileField(upload_to = "media/music", blank = False)
     category = models.CharField(choices = TEMPLATE_CHOICES, max_length = 20, null = True)
+    duration = models.FloatField(blank = True, null = True)
+    loudness = models.FloatField(blank = True, null = True)
+    gain = models.FloatField(blank = True, null = True)
     objects = models.Manager()
 
     def __str__(self):
@@ -187,20 +194,53 @@ class Videos(AbstractModel):
     gpt_answer = models.TextField(blank = True, null = True)
     prompt = models.ForeignKey(UserPrompt, related_name = 'video_prompt', on_delete = models.CASCADE)
     output = models.FileField(upload_to = "media/output", blank = True, null=True, max_length = 2000)
+    preview = models.FileField(upload_to = "media/output", blank = True, null=True, max_length = 2000)
     dir_name = models.TextField(default = "")
     voice_model = models.ForeignKey(VoiceModels, on_delete = models.SET_NULL, null = True, default = 1,
                                     db_constraint=False)
     avatar = models.ForeignKey(Avatars, on_delete = models.SET_NULL, null = True, default = None, blank = True,
                                db_constraint=False)
     status = models.CharField(max_length = 20, choices = VIDEO_STATUS, default = "RENDERING")
+    render_task_id = models.CharField(max_length = 50, blank = True, null = True)
+    render_key = models.CharField(max_length = 64, blank = True, default = "")
     music = models.ForeignKey(Music, blank = True, null = True, on_delete = models.SET_NULL)
     background = models.ForeignKey(Backgrounds, blank = True, null = True, on_delete = models.SET_NULL)
     intro = models.ForeignKey(Intro, blank = True, null = True, on_delete = models.SET_NULL)
     outro = models.ForeignKey(Outro, blank = True, null = True, on_delete = models.SET_NULL)
 
     mode = models.CharField(max_length = 30, choices=IMAGE_MODE, default = "WEB")
+    encoder_profile = models.CharField(max_length = 10, choices = ENCODER_PROFILE_CHOICES, blank = True, null = True)
 
     objects = models.Manager()
 
     def __str__(self):
         return f"{self.title} { str(self.id)}"
+
+
+class VideoRendition(models.Model):
+    video = models.ForeignKey(Videos, related_name = 'renditions', on_delete = models.CASCADE)
+    name = models.CharField(max_length = 10)
+    width = models.IntegerField()
+    height = models.IntegerField()
+    file = models.FileField(upload_to = "media/output", max_length = 2000)
+    objects = models.Manager()
+
+    def __str__(self):
+        return f"{self.video} {self.name}"
+
+
+class VideoStageProfile(models.Model):
+    video = models.ForeignKey(Videos, related_name = 'profiles', on_delete = models.CASCADE)
+    stage = models.CharField(max_length = 30)
+    wall_time = models.FloatField()
+    cpu_time = models.FloatField()
+    peak_rss = models.BigIntegerField()
+    bytes_written = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add = True)
+    objects = models.Manager()
+
+    class Meta:
+        ordering = ("id",)
+
+    def __str__(self):
+        return f"{self.video} {self.stage}"
@@ -0,0 +1,7 @@
+from django.urls import path
+from .consumers import RenderProgressConsumer
+
+
+websocket_urlpatterns = [
+    path('ws/video/<int:pk>/progress/', RenderProgressConsumer.as_asgi()),
+]
@@ -66,8 +66,24 @@ class UserpromptSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class VideoRenditionSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = VideoRendition
+        exclude = ("video",)
+
+
+class VideoStageProfileSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = VideoStageProfile
+        exclude = ("video",)
+
+
 class VideoSerializer(serializers.ModelSerializer):
     prompt = UserpromptSerializer()
+    renditions = VideoRenditionSerializer(many = True, read_only = True)
+    profiles = VideoStageProfileSerializer(many = True, read_only = True)
 
     class Meta:
         model = Videos
@@ -76,6 +92,8 @@ class VideoSerializer(serializers.ModelSerializer):
 
 class VideoNestedSerializer(serializers.ModelSerializer):
     prompt = UserpromptSerializer()
+    renditions = VideoRenditionSerializer(many = True, read_only = True)
+    profiles = VideoStageProfileSerializer(many = True, read_only = True)
     scenes = serializers.SerializerMethodField()
 
     class Meta:
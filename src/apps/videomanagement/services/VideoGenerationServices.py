@@ -3,6 +3,8 @@ from ..utils.prompt_utils import format_prompt
 from ..utils.gpt_utils import get_reply
 from ..utils.audio_utils import make_scenes_speech
 from ..utils.file_utils import generate_directory
+from ..utils.progress_utils import Progress
+from ..utils.profile_utils import StageProfiler
 from ..models import TemplatePrompts, Videos, VoiceModels, UserPrompt, Avatars, Intro, Outro
 from django.conf import settings
 from ..defaults import default_format
@@ -68,6 +70,8 @@ def generate_video(template_id: Union[str, int, None],
     ------
     - This function generates a video based on the provided parameters.
     - It uses various sources for text, images, and other elements to create the video.
+    - Every stage reports its progress to the websocket group of the video, ending with the "generated" stage.
+    - The llm, tts, music and images stages are profiled and the profiles saved on the video.
     """
 
     avatar_selection = int(avatar_selection) if avatar_selection.isnumeric() else "no_avatar"
@@ -87,7 +91,8 @@ def generate_video(template_id: Union[str, int, None],
     prompt = format_prompt(template_format = template_format, template_category = category,
                            userprompt = message, target_audience = target_audience)
 
-    x = get_reply(prompt, gpt_model = gpt_model)
+    with StageProfiler("llm") as llm_profile:
+        x = get_reply(prompt, gpt_model = gpt_model)
 
     user_rompt = UserPrompt.objects.create(template = template, prompt = F'{message}')
     user_rompt.save()
@@ -102,6 +107,7 @@ def generate_video(template_id: Union[str, int, None],
     vid = Videos.objects.create(title = x['title'], prompt = user_rompt, dir_name = dir_name, gpt_answer = x,
                                 background = background, intro = intro, outro = outro)
     logger.info(f"Created the video instance with id : {vid.id}")
+    llm_profile.save(vid)
 
     if avatar_selection != "no_avatar":
         selected_avatar = Avatars.select_avatar(selected = avatar_selection)
@@ -114,17 +120,22 @@ def generate_video(template_id: Union[str, int, None],
     vid.voice_model = voice_model
     vid.save()
 
-    make_scenes_speech(vid)
+    with StageProfiler("tts", video = vid):
+        make_scenes_speech(vid)
     logger.info(f"Generated the scenes audios for the video with id : {vid.id}")
 
-    vid.music = download_music(music)
+    Progress(vid.id, "music").start()
+    with StageProfiler("music", video = vid, folder = "media/music"):
+        vid.music = download_music(music)
 
     if images:
         vid.mode = images
-        create_image_scenes(vid, mode = images, style = style)
+        with StageProfiler("images", video = vid):
+            create_image_scenes(vid, mode = images, style = style)
         logger.info(f"Generated the images for the video with id : {vid.id}")
 
     vid.status = "GENERATION"
     vid.save()
+    Progress(vid.id, "generated").start()
 
     return vid
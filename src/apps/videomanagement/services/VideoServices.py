@@ -1,8 +1,15 @@
 from django.db import transaction
 import os
 from ..utils.audio_utils import update_scene
-from ..models import Videos, Avatars, Scene, SceneImage, Intro, Outro
+from ..models import Videos, Avatars, Scene, SceneImage, Intro, Outro, ENCODER_PROFILE_CHOICES
 from ..utils.download_utils import generate_new_image
+from ..utils.video_utils import make_preview, avatar_video_path, plan_timeline
+from ..tasks import render_video_task
+from ..utils.exceptions import RenderInProgressError, InvalidEncoderProfileError
+from celery.result import AsyncResult
+import uuid
+from django.conf import settings
+from typing import Union
 
 import logging
 
@@ -14,21 +21,35 @@ def video_update(video: Videos,
                  avatar: str = None,
                  intro: str = None,
                  outro: str = None,
+                 encoder_profile: str = None,
                  ) -> Videos:
 
     """
-    Update the specified video with new avatar, intro, or outro.
+    Update the specified video with new avatar, intro, outro or encoder profile.
 
     Args:
         video (Videos): The video instance to update.
         avatar (str, optional): The ID of the new avatar or "no_value" to remove the avatar. Defaults to None.
         intro (str, optional): The ID of the new intro or "no_value" to remove the intro. Defaults to None.
         outro (str, optional): The ID of the new outro or "no_value" to remove the outro. Defaults to None.
+        encoder_profile (str, optional): The encoder profile of the output, "auto", "standard", "slides" or
+        "motion", or "no_value" to use the one of the template again. Defaults to None.
 
     Returns:
         Videos: The updated video instance.
+
+    Raises:
+        InvalidEncoderProfileError: If the encoder profile is not one of ENCODER_PROFILE_CHOICES. Nothing is
+        updated then.
     """
 
+    profiles = [name for name, _ in ENCODER_PROFILE_CHOICES]
+    if encoder_profile and encoder_profile != "no_value" and encoder_profile not in profiles:
+        raise InvalidEncoderProfileError(encoder_profile, profiles)
+
+    if encoder_profile:
+        video.encoder_profile = None if encoder_profile == "no_value" else encoder_profile
+
     if avatar and avatar == "no_value":
         video.avatar = None
 
@@ -68,7 +89,132 @@ def video_regenerate(video: Videos) -> int:
             for scene_image in scenes_images:
                 generate_new_image(scene_image = scene_image, video = video)
 
-        if video.avatar and os.path.exists(rf'{os.getcwd()}\{video.dir_name}\output_avatar.mp4'):
-            os.remove(rf'{os.getcwd()}\{video.dir_name}\output_avatar.mp4')
+        if video.avatar and os.path.exists(avatar_video_path(video.dir_name)):
+            os.remove(avatar_video_path(video.dir_name))
+
+
+def video_render_async(video: Videos, backend: str = None, subtitle: bool = False, renditions: list = None) -> str:
+    """
+    Queue the render of the specified video on the celery workers.
+
+    Args:
+        video (Videos): The video instance to render.
+        backend (str, optional): "moviepy", "ffmpeg" or "distributed". Defaults to the RENDER_BACKEND setting.
+        subtitle (bool, optional): Whether to include subtitles in the video. Defaults to False.
+        renditions (list, optional): The extra renditions to write, like "720p". Defaults to the RENDER_RENDITIONS
+        setting.
+
+    Returns:
+        str: The id of the render task, also stored on the video.
+
+    Raises:
+        RenderInProgressError: If a render of the video is already queued or running. Two renders of the same
+        video would share its segments folder and delete each other's files.
+
+    If the task cannot be sent, the video gets its previous status back and no task id, so it is not reported
+    as queued forever, and the error is raised.
+    """
+
+    task_id = str(uuid.uuid4())
+    with transaction.atomic():
+        locked = Videos.objects.select_for_update().get(id = video.id)
+        if locked.status in ("QUEUED", "RENDERING") and locked.render_task_id and \
+                AsyncResult(locked.render_task_id).state != "FAILURE":
+            raise RenderInProgressError(locked.render_task_id)
+
+        previous = locked.status
+        locked.status = "QUEUED"
+        locked.render_task_id = task_id
+        locked.save(update_fields = ["status", "render_task_id"])
+
+    video.status, video.render_task_id = locked.status, locked.render_task_id
+
+    try:
+        render_video_task.apply_async(args = [video.id], kwargs = {"backend": backend, "subtitle": subtitle,
+                                                                  "renditions": renditions}, task_id = task_id)
+    except Exception:
+        logger.exception(f"Could not queue the render of the video with id : {video.id}")
+        Videos.objects.filter(id = video.id, render_task_id = task_id).update(status = previous,
+                                                                              render_task_id = None)
+        video.status, video.render_task_id = previous, None
+        raise
+
+    logger.info(f"Queued the render of the video with id : {video.id} as task {task_id}")
+    return task_id
+
+
+def video_render_status(video: Videos) -> dict:
+    """
+    Report the state of the last render of the specified video.
+
+    Args:
+        video (Videos): The video instance.
+
+    Returns:
+        dict: The status (queued, running, completed or failed) and the id of the render task.
+    """
+
+    statuses = {"QUEUED": "queued", "RENDERING": "running", "COMPLETED": "completed", "FAILED": "failed"}
+    state = statuses.get(video.status, video.status.lower())
+
+    if video.render_task_id and state in ("queued", "running") and \
+            AsyncResult(video.render_task_id).state == "FAILURE":
+        state = "failed"
+
+    return {"status": state, "task_id": video.render_task_id, "output": video.output.name if video.output else None}
+
+
+def video_preview(video: Videos, subtitle: bool = False) -> Videos:
+    """
+    Render a quick low resolution preview of the specified video, without touching its output.
+
+    Args:
+        video (Videos): The video instance to preview.
+        subtitle (bool, optional): Whether to include subtitles in the preview. Defaults to False.
+
+    Returns:
+        Videos: The video instance with its preview file.
+    """
+
+    return make_preview(video, subtitle = subtitle)
+
+
+def video_plan(video: Videos, subtitle: bool = False) -> dict:
+    """
+    Plan the timeline of the specified video without rendering it.
+
+    Args:
+        video (Videos): The video instance to plan.
+        subtitle (bool, optional): Whether to plan the subtitle track. Defaults to False.
+
+    Returns:
+        dict: The serializable timeline, the same one the moviepy and ffmpeg backends render, with the file paths
+        relative to the media root.
+    """
+
+    return media_paths(plan_timeline(video, subtitle = subtitle))
+
+
+PLAN_PATH_KEYS = ("audio", "mix", "source", "file", "intro", "outro")
+
+
+def media_paths(plan: Union[dict, list]) -> Union[dict, list]:
+    """
+    Replace the absolute file paths of a timeline plan with paths relative to the media root.
+
+    Args:
+        plan (Union[dict, list]): The plan, or a part of it.
+
+    Returns:
+        Union[dict, list]: The plan, with the paths of the PLAN_PATH_KEYS relative to MEDIA_ROOT.
+    """
+
+    if isinstance(plan, list):
+        return [media_paths(x) for x in plan]
 
+    if not isinstance(plan, dict):
+        return plan
 
+    return {key: os.path.relpath(os.path.abspath(value), settings.MEDIA_ROOT).replace("\\", "/")
+            if key in PLAN_PATH_KEYS and isinstance(value, str) else media_paths(value)
+            for key, value in plan.items()}
@@ -0,0 +1,169 @@
+"""
+Viddie is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as
+published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+Viddie is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+
+from celery import shared_task, chord
+from django.conf import settings
+from .models import Videos
+from .utils.video_utils import prepare_timeline, render_scene_segments, join_scene_segments, split_shards, \
+    rendition_outputs, save_renditions, make_video, render_fingerprint, is_rendered
+from .utils.ffmpeg_utils import transcode_renditions
+from .utils.progress_utils import Progress
+from .utils.profile_utils import StageProfiler
+from .utils.lease_utils import RenderLease, RENDER_LEASE
+
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind = True, acks_late = True, reject_on_worker_lost = True)
+def render_shard(self, timeline: dict, folder: str, first: int, last: int, video_id: int = None) -> list:
+    video = Videos.objects.get(id = video_id) if video_id else None
+    with RenderLease(f"shard:{folder}:{first}") as acquired:
+        if not acquired:
+            raise self.retry(countdown = RENDER_LEASE, max_retries = None)
+
+        logger.info(f"Rendering scenes {first} to {last} of {folder}")
+        with StageProfiler("encoding", video = video, folder = folder):
+            return render_scene_segments(timeline, timeline["scenes"][first:last], folder)
+
+
+@shared_task(bind = True, acks_late = True, reject_on_worker_lost = True)
+def merge_shards(self, shards: list, video_id: int, timeline: dict, renditions: list = None,
+                 render_key: str = "") -> int:
+    video = Videos.objects.get(id = video_id)
+    folder = f"{video.dir_name}/segments"
+    output = f"{video.dir_name}/output_video.mp4"
+    with RenderLease(f"video:{video_id}") as acquired:
+        if not acquired:
+            raise self.retry(countdown = RENDER_LEASE, max_retries = None)
+
+        Progress(video_id, "merging").start()
+        with StageProfiler("merging", video = video):
+            join_scene_segments(timeline, [segment for shard in shards for segment in shard], folder, output)
+
+        outputs = rendition_outputs(video, renditions)
+        if outputs:
+            with StageProfiler("renditions", video = video):
+                transcode_renditions(output, outputs, profile = timeline["encoder"])
+
+        save_renditions(video, outputs)
+
+        video.output = output
+        video.status = "COMPLETED"
+        video.render_key = render_key
+        video.save()
+
+    Progress(video_id, "completed").start()
+    logger.info(f"Merged {len(shards)} shards of the video with id : {video_id}")
+    return video_id
+
+
+def render_distributed(video: Videos, subtitle: bool = False, shards: int = None, renditions: list = None) -> Videos:
+    """
+    Render a video on several celery workers, one range of scenes each, and merge it when all of them finish.
+
+    Parameters:
+    -----------
+    video : Videos
+        The video to render.
+    subtitle : bool, optional
+        A flag indicating whether to include subtitles in the video. Default is False.
+    shards : int, optional
+        The number of scene ranges the video is split into. Default is the RENDER_SHARDS setting.
+    renditions : list, optional
+        The names of the extra renditions to write, like "720p". Default is the RENDER_RENDITIONS setting.
+
+    Returns:
+    --------
+    Videos
+        The video, still with the status "RENDERING". merge_shards sets it to "COMPLETED". If the inputs did not
+        change since the last render, the video is returned "COMPLETED" and nothing is dispatched.
+
+    Notes:
+    ------
+    - The dialogue track and the avatar video are created before dispatching, since every shard needs them.
+    - Workers must share the media folder, the shards only exchange segment paths through the result backend.
+    - The shard results reach merge_shards in dispatch order, so the merge is deterministic.
+    - Every shard saves its own "encoding" profile, with the wall time and resources of its worker, and the merge
+      saves the "merging" and "renditions" ones.
+    - If a shard or the merge fails, render_failed sets the video to "FAILED".
+    - The tasks are acknowledged when they finish, so the task of a worker that dies is delivered to another one,
+      which skips the segments that are already cached. Every task holds a RenderLease while it runs, so a copy
+      of it that redis redelivers while it is still running waits for it instead of writing the same files.
+    """
+
+    key = render_fingerprint(video, subtitle = subtitle, backend = "distributed", renditions = renditions)
+    if is_rendered(video, key, renditions):
+        logger.info(f"The video with id : {video.id} did not change since its last render")
+        video.status = "COMPLETED"
+        video.save(update_fields = ["status"])
+        Progress(video.id, "completed").start()
+        return video
+
+    video.render_key = ""
+    video.save(update_fields = ["render_key"])
+
+    timeline = prepare_timeline(video, subtitle = subtitle)
+    folder = f"{video.dir_name}/segments"
+    ranges = split_shards(timeline["scenes"], shards or settings.RENDER_SHARDS)
+
+    chord(render_shard.s(timeline, folder, first, last, video.id) for first, last in ranges)(
+        merge_shards.s(video.id, timeline, renditions, key).on_error(render_failed.si(video.id)))
+
+    logger.info(f"Dispatched {len(ranges)} shards of the video with id : {video.id}")
+    return video
+
+
+def render(video: Videos, backend: str = None, subtitle: bool = False, renditions: list = None) -> Videos:
+    """
+    Render the video with the selected backend, on this process or, for "distributed", on the celery workers.
+    """
+
+    if (backend or settings.RENDER_BACKEND) == "distributed":
+        return render_distributed(video, subtitle = subtitle, renditions = renditions)
+
+    return make_video(video, subtitle = subtitle, backend = backend, renditions = renditions)
+
+
+@shared_task
+def render_failed(video_id: int) -> None:
+    Videos.objects.filter(id = video_id).update(status = "FAILED", render_key = "")
+    Progress(video_id, "failed").start()
+    logger.error(f"Render of the video with id : {video_id} failed")
+
+
+@shared_task(bind = True, acks_late = True, reject_on_worker_lost = True)
+def render_video_task(self, video_id: int, backend: str = None, subtitle: bool = False,
+                      renditions: list = None) -> int:
+    video = Videos.objects.get(id = video_id)
+    if video.render_task_id != self.request.id:
+        logger.warning(f"The task {self.request.id} is not the render of the video with id : {video_id} anymore, "
+                       f"{video.render_task_id} is")
+        return video_id
+
+    with RenderLease(f"video:{video_id}") as acquired:
+        if not acquired:
+            raise self.retry(countdown = RENDER_LEASE, max_retries = None)
+
+        video.status = "RENDERING"
+        video.save(update_fields = ["status"])
+
+        try:
+            render(video, backend = backend, subtitle = subtitle, renditions = renditions)
+
+        except Exception:
+            render_failed(video_id)
+            raise
+
+    return video_id
@@ -1,7 +1,7 @@
 from .views.general_views import TemplatePromptView,IntroView, OutroView, AvatarView, VoiceView, SceneImageView, download_playlist
 from .views.generate_view import GenerateView
 from .views.scene_view import SceneView
-from .views.video_view import VideoView
+from .views.video_view import VideoView, hls_file
 
 from rest_framework import routers
 from django.urls import path
@@ -21,6 +21,7 @@ router.register('outro', OutroView)
 
 
 urlpatterns = [path('downloadplaylist/', download_playlist),
+               path('video/<int:pk>/hls/<str:name>', hls_file),
                ]
 
 
@@ -1,5 +1,6 @@
 from .tts_utils import  save, ApiSyn, create_model
 from ..models import Scene, Videos
+from .progress_utils import Progress
 import uuid
 
 
@@ -21,6 +22,7 @@ def make_scenes_speech(video: Videos) -> None:
     - This function generates speech audio files for each scene in the video based on the provided GPT-3.5 answer.
     - The speech synthesis can be performed using either a local model or an API, depending on the settings in the video object.
     - Each scene's dialogue or narration text is converted to speech and saved as a WAV file in the video's directory.
+    - The index of every scene done is sent to the websocket group of the video.
     """
 
     dir_name = video.dir_name
@@ -38,6 +40,9 @@ def make_scenes_speech(video: Videos) -> None:
     elif voice_model.type.lower() == 'api':
         syn = ApiSyn(provider =video.voice_model.provider, path = video.voice_model.path)
 
+    scenes = sum(len(j[search_field]) for j in gpt_answer["scenes"]) if is_sentenced else len(gpt_answer["scenes"])
+    progress = Progress(video.id, "speech", scenes = scenes).start()
+    done = 0
     for j in gpt_answer["scenes"]:
         if is_sentenced:
             for index, sentence in enumerate(j[search_field]):
@@ -46,11 +51,15 @@ def make_scenes_speech(video: Videos) -> None:
                 sound = save(syn, sentence[narration_field], save_path = f'{dir_name}/dialogues/{filename}.wav')
                 Scene.objects.create(file = sound, prompt = video.prompt, text = sentence[narration_field].strip(),
                                      is_last = index == len(j[search_field]) - 1)
+                progress.update(scene = done)
+                done += 1
 
         else:
             filename = str(uuid.uuid4())
             sound = save(syn, j['dialogue'], save_path = f'{dir_name}/dialogues/{filename}.wav')
             Scene.objects.create(file = sound, prompt = video.prompt, text = j['dialogue'].strip())
+            progress.update(scene = done)
+            done += 1
 
     return
 
@@ -0,0 +1,79 @@
+from typing import Union
+import json
+import os
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class RenderManifest:
+    """
+    Keep the checkpoints of a render in a manifest file of the video folder, so a retried render resumes from
+    the stages that already finished.
+
+    Parameters:
+    -----------
+    dir_name : str
+        The folder of the video.
+
+    Notes:
+    ------
+    - Every stage is stored with the key of its inputs and the size of its outputs. A stage is done only if its
+      key did not change and all of its outputs still exist with the same size, so a file a dead worker left half
+      written is never reused.
+    - The manifest is replaced atomically, so a worker killed while it is written leaves the previous one.
+    - Use it as :
+
+        manifest = RenderManifest(video.dir_name)
+        if not manifest.done("avatar", key):
+            ...
+            manifest.save("avatar", key, [output])
+    """
+
+    def __init__(self, dir_name: str):
+        self.path = f"{dir_name}/render_manifest.json"
+        self.stages = self.load()
+
+    def load(self) -> dict:
+        try:
+            with open(self.path, encoding = "utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def done(self, stage: str, key: str) -> bool:
+        """
+        Check if a stage finished with the same inputs and its outputs are still intact.
+        """
+
+        entry = self.stages.get(stage)
+        if not entry or entry["key"] != key:
+            return False
+
+        for output, size in entry["outputs"].items():
+            if not os.path.exists(output) or os.path.getsize(output) != size:
+                logger.warning(f"The checkpoint {stage} of {self.path} is not valid anymore, {output} changed")
+                return False
+
+        return True
+
+    def outputs(self, stage: str) -> Union[list, None]:
+        """
+        Return the outputs of a finished stage, in the order they were saved.
+        """
+
+        entry = self.stages.get(stage)
+        return list(entry["outputs"]) if entry else None
+
+    def save(self, stage: str, key: str, outputs: list) -> None:
+        """
+        Record a finished stage, with the key of its inputs and its outputs.
+        """
+
+        self.stages[stage] = {"key": key, "outputs": {x: os.path.getsize(x) for x in outputs}}
+        with open(f"{self.path}.tmp", "w", encoding = "utf-8") as file:
+            json.dump(self.stages, file, indent = 2)
+
+        os.replace(f"{self.path}.tmp", self.path)
+        logger.info(f"Checkpoint {stage} saved to {self.path}")
@@ -0,0 +1,179 @@
+from moviepy.editor import ImageClip, VideoFileClip, VideoClip, CompositeVideoClip, concatenate_videoclips
+from .ffmpeg_utils import probe, OUTPUT_SIZE
+from django.conf import settings
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+def slot_bytes(slot: dict, size: tuple) -> int:
+    """
+    Estimate the memory a scene slot holds while it is open.
+
+    Parameters:
+    -----------
+    slot : dict
+        The timeline slot.
+    size : tuple
+        The slot size, the cached images are already resized to it.
+
+    Returns:
+    --------
+    int
+        The estimated bytes, a decoded RGB frame for images and a few frames of reader buffer for videos.
+    """
+
+    if slot["type"] == "image":
+        return size[0] * size[1] * 3
+
+    if slot["type"] == "video":
+        stream = next(x for x in probe(slot["file"])["streams"] if x["codec_type"] == "video")
+        return stream["width"] * stream["height"] * 3 * 5
+
+    return 0
+
+
+def plan_windows(timeline: dict, cap: int) -> list:
+    """
+    Group the timeline scenes into consecutive windows whose sources fit in the memory cap.
+
+    Parameters:
+    -----------
+    timeline : dict
+        The timeline of the video.
+    cap : int
+        The maximum bytes of sources open at the same time.
+
+    Returns:
+    --------
+    list
+        The windows, each one with its 'scenes', 'start' and 'end'. A scene that does not fit in the cap on its
+        own gets a window of its own.
+    """
+
+    size = timeline["background"]["slot_size"] if timeline["background"] else OUTPUT_SIZE
+    windows = []
+    used = 0
+    for scene in timeline["scenes"]:
+        scene_bytes = sum(slot_bytes(slot, size) for slot in scene["slots"])
+        if not windows or used + scene_bytes > cap:
+            windows.append({"scenes": [], "start": scene["start"]})
+            used = 0
+
+        windows[-1]["scenes"].append(scene)
+        windows[-1]["end"] = scene["start"] + scene["duration"]
+        used += scene_bytes
+
+    return windows
+
+
+class StreamingCompositor:
+    """
+    Compose the main part of a video window by window, so only the sources of the current window are open.
+
+    Parameters:
+    -----------
+    timeline : dict
+        The timeline of the video, as built by video_utils.collect_timeline.
+    cap : int, optional
+        The maximum bytes of scene sources open at the same time. Default is the RENDER_MEMORY_CAP setting.
+
+    Notes:
+    ------
+    - clip returns a moviepy clip of the whole timeline. Its frames are composed on demand, and when a frame of
+      the next window is requested the sources of the current one are closed before the next ones are opened.
+    - moviepy asks for the frames in order while writing, so every window is opened once.
+    - The layout is the same as the one make_video composes with moviepy : the slots on the keyed background,
+      or centered and resized to 1920x1080 without it, and the avatar at the top right.
+    - The subtitles are not composed per frame, make_video burns the ASS document of the timeline in while
+      encoding.
+    """
+
+    def __init__(self, timeline: dict, cap: int = None):
+        self.timeline = timeline
+        self.windows = plan_windows(timeline, cap or settings.RENDER_MEMORY_CAP)
+        self.current = None
+        self.composite = None
+        self.sources = []
+        self.background = ImageClip(timeline["background"]["file"]) if timeline["background"] else None
+        self.black = ImageClip(r'assets\black.jpg')
+        logger.info(f"Composing {len(timeline['scenes'])} scenes in {len(self.windows)} windows")
+
+    def slot_clip(self, slot: dict):
+        black = self.black
+        if slot["type"] == "image":
+            try:
+                image = ImageClip(slot["file"]).set_duration(slot["duration"])
+                return image.fadein(slot["fade_in"]).fadeout(slot["fade_out"])
+            except ValueError:
+                return black.set_duration(slot["duration"])
+
+        if slot["type"] == "video":
+            vid_scene = VideoFileClip(slot["file"]).without_audio()
+            self.sources.append(vid_scene)
+            if vid_scene.duration >= slot["duration"]:
+                vid_scene = vid_scene.subclip(0, slot["duration"])
+
+            return vid_scene.fadein(slot["fade_in"]).fadeout(slot["fade_out"])
+
+        return black.set_duration(slot["duration"])
+
+    def open(self, window: dict) -> None:
+        """
+        Open the sources of a window and compose it.
+        """
+
+        timeline = self.timeline
+        duration = window["end"] - window["start"]
+        first = window["start"] == 0
+        last = window["end"] >= timeline["duration"] - 0.001
+
+        slots = concatenate_videoclips([self.slot_clip(slot) for scene in window["scenes"] for slot in scene["slots"]])
+        if self.background:
+            background = timeline["background"]
+            composite = CompositeVideoClip([slots.margin(top = background["top"], left = background["left"],
+                                                         opacity = 4),
+                                            self.background.set_duration(duration)], size = OUTPUT_SIZE)
+        else:
+            composite = slots.set_position('center').resize(OUTPUT_SIZE)
+
+        if timeline["avatar"]:
+            avatar = VideoFileClip(timeline["avatar"]).without_audio()
+            self.sources.append(avatar)
+            avatar = avatar.subclip(window["start"], min(window["end"], avatar.duration)).\
+                set_position(("right", "top"))
+            if not self.background:
+                avatar = avatar.fadein(2) if first else avatar
+                avatar = avatar.fadeout(2) if last else avatar
+
+            composite = CompositeVideoClip([composite, avatar], size = OUTPUT_SIZE)
+
+        self.composite = composite.set_duration(duration)
+        self.current = window
+
+    def close(self) -> None:
+        """
+        Close the sources of the current window.
+        """
+
+        for source in self.sources:
+            source.close()
+
+        self.sources = []
+        self.composite = None
+        self.current = None
+
+    def frame(self, t: float):
+        window = self.current
+        if window is None or not window["start"] <= t < window["end"]:
+            window = next((x for x in self.windows if x["start"] <= t < x["end"]), self.windows[-1])
+            if window is not self.current:
+                self.close()
+                self.open(window)
+
+        return self.composite.get_frame(min(t - window["start"], self.composite.duration - 0.001))
+
+    def clip(self) -> VideoClip:
+        clip = VideoClip(make_frame = self.frame, duration = self.timeline["duration"])
+        return clip.fadein(2).fadeout(2) if self.background else clip
@@ -14,8 +14,11 @@ from .video_utils import split_video_and_mp3, add_text_to_video
 import logging
 import json
 import sys
+import subprocess
 import urllib.request
 from .mapper import modes, default_providers
+from .progress_utils import Progress
+from .mixer_utils import analyze_music
 
 
 logger = logging.getLogger(__name__)
@@ -43,7 +46,8 @@ def download_playlist(url: str, category: str) -> None:
     - This function uses pytube library to download each video in the playlist as an audio file (MP3).
     - The downloaded audio files are saved in the 'media/music' directory.
     - Each downloaded audio file is renamed with a unique filename generated using uuid.
-    - Information about each downloaded music file is stored in the Music model.
+    - Information about each downloaded music file is stored in the Music model, with its duration, loudness and
+      normalized gain.
     """
     playlist = Playlist(url)
     for music in playlist.videos:
@@ -58,10 +62,16 @@ def download_playlist(url: str, category: str) -> None:
 
             os.rename(song, new_file)
 
-            Music.objects.create(name = stream.title, file = new_file, category = category)
+            music = Music.objects.create(name = stream.title, file = new_file, category = category)
 
         except FileNotDownloadedError:
             logger.error("Error downloading song")
+            continue
+
+        try:
+            analyze_music(music)
+        except (subprocess.CalledProcessError, ValueError) as ex:
+            logger.error(f"Could not analyze the song {music.name}, it will be analyzed when it is used : {ex}")
 
 
 def download_image(query: str, path: str, amount: int = 1, *args, **kwargs) -> list[str]:
@@ -186,6 +196,7 @@ def download_music(url: str) -> str:
     - This function downloads the audio from the provided YouTube video URL.
     - The downloaded audio is saved as an MP3 file in the 'media/music' directory.
     - If the same music is already downloaded, it returns the existing Music object without downloading again.
+    - The duration, loudness and normalized gain of new music are measured once and stored on it.
     """
 
     if url is None:
@@ -203,6 +214,11 @@ def download_music(url: str) -> str:
     new_file = f'media/music/{filename}.mp3'
     os.rename(video, new_file)
     mus = Music.objects.create(name = yt.title, file = new_file, category = "ΟΤΗΕR")
+    try:
+        analyze_music(mus)
+    except (subprocess.CalledProcessError, ValueError) as ex:
+        logger.error(f"Could not analyze the song {mus.name}, it will be analyzed when it is used : {ex}")
+
     return mus
 
 
@@ -326,6 +342,7 @@ def create_image_scenes(video: Videos, mode: str = "WEB", style: str = "natural"
     ------
     - This function iterates over scenes in a video's GPT answer and creates image scenes based on the scene descriptions.
     - The mode and style parameters determine the method and style of image creation.
+    - The index of every scene done is sent to the websocket group of the video.
     """
 
     is_sentenced = True if video.prompt.template is None else video.prompt.template.is_sentenced
@@ -337,7 +354,11 @@ def create_image_scenes(video: Videos, mode: str = "WEB", style: str = "natural"
 
     narration_field = "sentence" if "sentence" in first_scene[search_field][0] else "narration"
 
-    for j in video.gpt_answer['scenes']:
+    scenes = video.gpt_answer['scenes']
+    progress = Progress(video.id, "images",
+                        scenes = sum(len(j[search_field]) for j in scenes) if is_sentenced else len(scenes)).start()
+    done = 0
+    for j in scenes:
         if is_sentenced:
             for x in j[search_field]:
                 create_image_scene(video.prompt,
@@ -347,6 +368,8 @@ def create_image_scenes(video: Videos, mode: str = "WEB", style: str = "natural"
                                    mode=mode,
                                    style=style,
                                    title = video.title)
+                progress.update(scene = done)
+                done += 1
 
         else:
             create_image_scene(video.prompt,
@@ -356,6 +379,8 @@ def create_image_scenes(video: Videos, mode: str = "WEB", style: str = "natural"
                                mode=mode,
                                style=style,
                                title = video.title)
+            progress.update(scene = done)
+            done += 1
 
 
 def generate_new_image(scene_image: SceneImage, video: Videos, style: str = "vivid") -> SceneImage:
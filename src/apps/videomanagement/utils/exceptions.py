@@ -39,3 +39,15 @@ class InvalidTwitchToken(Exception):
 class HeaderInitiationError(Exception):
     def __init__(self):
         self.message = "You need to set headers !"
+
+
+class RenderInProgressError(Exception):
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.message = "The video is already queued or rendering"
+
+
+class InvalidEncoderProfileError(Exception):
+    def __init__(self, name: str, choices: list):
+        self.name = name
+        self.message = f"Unknown encoder profile {name}, use one of : {', '.join(choices)}"
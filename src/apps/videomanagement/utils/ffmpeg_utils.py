@@ -0,0 +1,849 @@
+from django.conf import settings
+from typing import Callable
+import subprocess
+import json
+import os
+
+
+OUTPUT_SIZE = (1920, 1080)
+OUTPUT_FPS = 24
+AUDIO_RATE = 44100
+AVATAR_SCALE = 1.5  # The avatar track is created at this scale of the SadTalker video
+
+RENDITIONS = {"1080p": (1920, 1080), "720p": (1280, 720), "480p": (854, 480), "360p": (640, 360)}
+
+RENDER_PROFILES = {
+    "final": {"size": OUTPUT_SIZE, "fps": OUTPUT_FPS, "preset": "medium", "crf": 23},
+    "preview": {"size": (640, 360), "fps": 12, "preset": "ultrafast", "crf": 32},
+}
+
+# Encoder settings of the final output, picked per video by the makeup of its timeline, see encoder_profile
+ENCODER_PROFILES = {
+    "standard": {"preset": "medium", "crf": 23, "keyint": OUTPUT_FPS * 2, "tune": None},
+    "slides": {"preset": "veryfast", "crf": 26, "keyint": OUTPUT_FPS * 10, "tune": "stillimage"},
+    "motion": {"preset": "medium", "crf": 21, "keyint": OUTPUT_FPS * 2, "tune": "film"},
+}
+MOTION_SHARE = 0.3  # The share of the timeline in video slots from which the "motion" profile is picked
+AUDIO_CODEC_ARGS = ['-c:a', 'aac', '-b:a', '192k', '-ar', AUDIO_RATE, '-ac', 2]
+MP4_VIDEO_CODECS = ('h264', 'hevc', 'av1', 'mpeg4')  # Video codecs that can be copied to an mp4 as they are
+AUDIO_COPY_FORMATS = {'mp3': 'mp3', 'aac': 'm4a'}  # Audio codecs that can be copied, with their file extension
+
+
+def encoder_args(profile: dict) -> list:
+    """
+    Return the rate control arguments of a render profile : its crf, and its keyframe interval and tune if any.
+    """
+
+    tune = ['-tune', profile['tune']] if profile.get('tune') else []
+    keyint = ['-g', profile['keyint']] if profile.get('keyint') else []
+    return ['-crf', profile['crf'], *keyint, *tune]
+
+
+def video_codec_args(profile: dict = None, vfr: bool = False) -> list:
+    """
+    Return the libx264 encoder arguments of a render profile, the "final" profile by default.
+
+    Notes:
+    ------
+    - Every segment of the same profile is encoded with the same arguments, so they can be joined by stream copy.
+    - With vfr the frame timestamps of the filter graph are kept instead of forcing a constant frame rate, so
+      frames dropped by the graph are not duplicated again before the encoder.
+    """
+
+    profile = profile or RENDER_PROFILES["final"]
+    rate = ['-fps_mode', 'vfr'] if vfr else ['-r', profile['fps']]
+    return ['-c:v', 'libx264', '-preset', profile['preset'], *encoder_args(profile), '-pix_fmt', 'yuv420p',
+            *rate, '-video_track_timescale', profile['fps'] * 512]
+
+
+def encoder_profile(name: str, timeline: dict) -> dict:
+    """
+    Return the render profile of the final output for an encoder profile name.
+
+    Parameters:
+    -----------
+    name : str
+        The name of one of the ENCODER_PROFILES, or "auto" to pick one from the timeline.
+    timeline : dict
+        The timeline, or the plan, of the video.
+
+    Returns:
+    --------
+    dict
+        The "final" render profile with the preset, crf, keyframe interval and tune of the encoder profile, and
+        its 'name'.
+
+    Notes:
+    ------
+    - "auto" picks "motion" when at least MOTION_SHARE of the timeline is made of video slots, "slides" when it
+      only has images on a still background and no avatar, and "standard" otherwise.
+    - Slides repeat the same frame for seconds, so a fast preset, a higher crf and rare keyframes barely change
+      the picture while they cut the encode time and the file size. Downloaded clips need the lower crf.
+    """
+
+    if name not in ENCODER_PROFILES:
+        slots = [slot for scene in timeline['scenes'] for slot in scene['slots']]
+        video_share = sum(x['duration'] for x in slots if x['type'] == 'video') / (timeline['duration'] or 1)
+        if video_share >= MOTION_SHARE:
+            name = 'motion'
+        elif not video_share and not timeline['avatar_track']:
+            name = 'slides'
+        else:
+            name = 'standard'
+
+    return {**RENDER_PROFILES['final'], **ENCODER_PROFILES[name], 'name': name}
+
+
+def run_ffmpeg(args: list, on_progress: Callable = None) -> None:
+    """
+    Run ffmpeg with the given arguments, overwriting any existing output.
+
+    Parameters:
+    -----------
+    args : list
+        The ffmpeg arguments, without the binary itself.
+    on_progress : Callable, optional
+        Called with the number of frames encoded so far, every time ffmpeg reports its progress.
+
+    Returns:
+    --------
+    None
+
+    Notes:
+    ------
+    - Raises subprocess.CalledProcessError if ffmpeg exits with a non zero code.
+    - The progress is read from the key=value lines ffmpeg writes to stdout with -progress.
+    """
+
+    command = [settings.FFMPEG_BINARY, '-y', '-hide_banner', '-loglevel', 'error', *[str(x) for x in args]]
+    if on_progress is None:
+        subprocess.run(command, check = True)
+        return
+
+    command[1:1] = ['-progress', 'pipe:1', '-nostats']
+    with subprocess.Popen(command, stdout = subprocess.PIPE, text = True) as process:
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            if key == 'frame' and value.isdigit():
+                on_progress(int(value))
+
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+
+def probe(path: str) -> dict:
+    """
+    Read the format and stream information of a media file with ffprobe.
+
+    Parameters:
+    -----------
+    path : str
+        The file path of the media file.
+
+    Returns:
+    --------
+    dict
+        The ffprobe json output, with the 'format' and 'streams' keys.
+    """
+
+    result = subprocess.run([settings.FFPROBE_BINARY, '-v', 'error', '-show_format', '-show_streams',
+                             '-of', 'json', path], check = True, capture_output = True, text = True)
+    return json.loads(result.stdout)
+
+
+def probe_duration(path: str) -> float:
+    """
+    Return the duration of a media file in seconds.
+    """
+
+    return float(probe(path)['format']['duration'])
+
+
+def probe_video_duration(path: str) -> float:
+    """
+    Return the duration of the first video stream of a media file in seconds.
+    """
+
+    streams = [x for x in probe(path)['streams'] if x.get('codec_type') == 'video']
+    return float(streams[0].get('duration', 0)) if streams else probe_duration(path)
+
+
+def measure_loudness(path: str) -> float:
+    """
+    Measure the integrated loudness of a media file in LUFS, with the first pass of the loudnorm filter.
+
+    Notes:
+    ------
+    - Returns -inf for silent files.
+    """
+
+    result = subprocess.run([settings.FFMPEG_BINARY, '-hide_banner', '-nostats', '-i', path, '-vn',
+                             '-af', 'loudnorm=print_format=json', '-f', 'null', '-'],
+                            check = True, capture_output = True, text = True)
+
+    stats = json.loads(result.stderr[result.stderr.rindex('{'):result.stderr.rindex('}') + 1])
+    return float(stats['input_i'])
+
+
+def has_audio_stream(path: str) -> bool:
+    """
+    Check if the media file contains at least one audio stream.
+    """
+
+    return any(stream.get('codec_type') == 'audio' for stream in probe(path)['streams'])
+
+
+def even(value: float) -> int:
+    """
+    Round a dimension down to the closest even integer, as required by yuv420p encoders.
+    """
+
+    return int(value) // 2 * 2
+
+
+def escape_path(path: str) -> str:
+    """
+    Escape a file path so it can be used as a filter option value inside a filter graph.
+    """
+
+    return path.replace('\\', '/').replace(':', r'\:').replace("'", r"\'")
+
+
+class FilterGraph:
+    """
+    Small builder for ffmpeg command lines that use a single filter_complex graph.
+
+    Inputs are registered with add_input and referenced by their index, filter chains are appended with add and
+    intermediate pads are named with label so chains never collide. Sources of the graph run at its fps.
+    """
+
+    def __init__(self, fps: int = OUTPUT_FPS):
+        self.fps = fps
+        self.inputs = []
+        self.filters = []
+        self._labels = 0
+
+    def add_input(self, path: str, *options) -> int:
+        self.inputs.append([*options, '-i', path])
+        return len(self.inputs) - 1
+
+    def label(self, prefix: str = 'v') -> str:
+        self._labels += 1
+        return f'{prefix}{self._labels}'
+
+    def add(self, chain: str) -> None:
+        self.filters.append(chain)
+
+    def write_script(self, path: str) -> str:
+        with open(path, 'w', encoding = 'utf-8') as script:
+            script.write(';\n'.join(self.filters))
+
+        return path
+
+    def input_args(self) -> list:
+        return [arg for options in self.inputs for arg in options]
+
+
+def slot_chain(graph: FilterGraph, slot: dict, size: tuple) -> str:
+    """
+    Add the filters of one timeline slot (image, video or blank) and return the label of its output pad.
+
+    Parameters:
+    -----------
+    graph : FilterGraph
+        The graph to add the slot to.
+    slot : dict
+        The slot with the 'type', 'file' and 'duration' keys.
+    size : tuple
+        The width and height the slot is scaled to.
+
+    Returns:
+    --------
+    str
+        The label of the slot output pad.
+
+    Notes:
+    ------
+    - Images and videos fade from and to black for the 'fade_in' and 'fade_out' seconds of the plan.
+    - Videos are cut to the slot duration, or hold their last frame if they are shorter than it.
+    - Slots with the 'still' key are not faded, they are used to compose a single frame of the slot.
+    """
+
+    w, h = even(size[0]), even(size[1])
+    duration = slot['duration']
+    out = graph.label('s')
+    fades = 'null' if slot.get('still') else \
+        f"fade=t=in:st=0:d={slot['fade_in']:.3f},fade=t=out:st={duration - slot['fade_out']:.3f}:" \
+        f"d={slot['fade_out']:.3f}"
+
+    if slot['type'] == 'image':
+        index = graph.add_input(slot['file'], '-loop', 1, '-framerate', graph.fps, '-t', f'{duration:.3f}')
+        graph.add(f'[{index}:v]scale={w}:{h},setsar=1,fps={graph.fps},format=yuv420p,{fades}[{out}]')
+
+    elif slot['type'] == 'video':
+        index = graph.add_input(slot['file'], '-t', f'{duration:.3f}')
+        graph.add(f'[{index}:v]scale={w}:{h},setsar=1,fps={graph.fps},format=yuv420p,'
+                  f'tpad=stop_mode=clone:stop_duration={duration:.3f},trim=duration={duration:.3f},'
+                  f'setpts=PTS-STARTPTS,{fades}[{out}]')
+
+    else:
+        graph.add(f'color=c=black:s={w}x{h}:r={graph.fps}:d={duration:.3f},format=yuv420p[{out}]')
+
+    return out
+
+
+def bumper_chain(graph: FilterGraph, path: str, size: tuple = OUTPUT_SIZE) -> tuple:
+    """
+    Add an intro or outro clip to the graph and return the labels of its video and audio pads.
+
+    Notes:
+    ------
+    - Like concatenate_videoclips(method='compose'), clips smaller than the output are centered on black.
+    - At a size smaller than 1920x1080 the clip is scaled down by the same factor as the rest of the video.
+    - Clips without an audio stream get silence of the same length, so they can be concatenated.
+    """
+
+    w, h = even(size[0]), even(size[1])
+    scale = w / OUTPUT_SIZE[0]
+    index = graph.add_input(path)
+    video_out, audio_out = graph.label('bv'), graph.label('ba')
+    graph.add(f"[{index}:v]scale='min(iw*{scale},{w})':'min(ih*{scale},{h})':force_original_aspect_ratio=decrease,"
+              f"pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={graph.fps},format=yuv420p[{video_out}]")
+
+    if has_audio_stream(path):
+        graph.add(f'[{index}:a]aresample={AUDIO_RATE},aformat=sample_fmts=fltp:channel_layouts=stereo[{audio_out}]')
+    else:
+        graph.add(f'anullsrc=r={AUDIO_RATE}:cl=stereo,atrim=duration={probe_duration(path):.3f},'
+                  f'aformat=sample_fmts=fltp:channel_layouts=stereo[{audio_out}]')
+
+    return video_out, audio_out
+
+
+def drawtext_filters(overlays: list) -> list:
+    """
+    Return the drawtext filters of a list of text overlays of a clip.
+
+    Parameters:
+    -----------
+    overlays : list
+        The text overlays, each one with its 'textfile', 'fontsize', 'fontcolor', 'x' and 'y', and optionally the
+        'start' and 'end' seconds it is shown between.
+
+    Returns:
+    --------
+    list
+        The drawtext filters, to be chained in a single filter so all the overlays are drawn in one encode.
+
+    Notes:
+    ------
+    - The text is read from its textfile, so quotes and colons in it need no escaping.
+    """
+
+    filters = []
+    for overlay in overlays:
+        first, last = overlay.get('start'), overlay.get('end')
+        enable = ''
+        if first is not None or last is not None:
+            enable = f":enable='between(t,{first or 0:.3f},{1e9 if last is None else last:.3f})'"
+
+        filters.append(f"drawtext=textfile='{escape_path(overlay['textfile'])}':fontsize={overlay['fontsize']}:"
+                       f"fontcolor={overlay['fontcolor']}:x={overlay['x']}:y={overlay['y']}{enable}")
+
+    return filters
+
+
+def compose_chain(graph: FilterGraph, timeline: dict, scenes: list, start: float, duration: float,
+                  size: tuple = OUTPUT_SIZE) -> str:
+    """
+    Add the visual composition of a range of scenes to the graph and return the label of its output pad.
+
+    Parameters:
+    -----------
+    graph : FilterGraph
+        The graph to add the composition to.
+    timeline : dict
+        The timeline of the video, as built by video_utils.collect_timeline.
+    scenes : list
+        The consecutive timeline scenes to compose.
+    start : float
+        The start of the first scene in the timeline, in seconds.
+    duration : float
+        The total duration of the scenes, in seconds.
+    size : tuple, optional
+        The size the scenes are composed at. Default is 1920x1080.
+
+    Returns:
+    --------
+    str
+        The label of the composed video pad.
+
+    Notes:
+    ------
+    - The background is the keyed png of the Backgrounds, decoded once and repeated by the overlay, so no chroma
+      key is calculated while rendering.
+    - The background and avatar fades only happen at the start and at the end of the whole timeline, so ranges
+      in the middle of the video compose exactly like the same seconds of a whole render.
+    - The avatar track is already at its overlay size, see video_utils.create_avatar_video.
+    - At a smaller size the slots, the background, its offsets and the avatar are scaled down before they are
+      composed, so a preview only composes the pixels it encodes. The subtitles are scaled by libass.
+    - The subtitles are burnt in from the single ASS document of the timeline, see subtitle_utils.write_ass. The
+      range is shifted to its timeline position while they are drawn, so a range shows its own lines.
+    """
+
+    background = timeline['background']
+    is_first = start == 0
+    is_last = start + duration >= timeline['duration'] - 0.001
+
+    w, h = even(size[0]), even(size[1])
+    scale = w / OUTPUT_SIZE[0]
+    slot_size = [x * scale for x in background['slot_size']] if background else (w, h)
+    slots = [slot_chain(graph, slot, slot_size) for scene in scenes for slot in scene['slots']]
+    current = graph.label('c')
+    graph.add(f"{''.join(f'[{x}]' for x in slots)}concat=n={len(slots)}:v=1:a=0[{current}]")
+
+    if background:
+        canvas, placed, base = graph.label('c'), graph.label('c'), graph.label('c')
+        fades = ''
+        if is_first:
+            fades += f',fade=t=in:st=0:d={min(2, duration):.3f}'
+        if is_last:
+            fades += f',fade=t=out:st={max(duration - 2, 0):.3f}:d={min(2, duration):.3f}'
+
+        back = graph.add_input(background['file'])
+        keyed = f'{back}:v'
+        if scale != 1:
+            keyed = graph.label('c')
+            graph.add(f'[{back}:v]scale={w}:{h}[{keyed}]')
+
+        graph.add(f'color=c=black:s={w}x{h}:r={graph.fps}:d={duration:.3f}[{canvas}]')
+        graph.add(f"[{canvas}][{current}]overlay=x={round(background['left'] * scale)}:"
+                  f"y={round(background['top'] * scale)}:eof_action=pass[{placed}]")
+        graph.add(f'[{placed}][{keyed}]overlay=0:0:eof_action=repeat{fades}[{base}]')
+        current = base
+
+    if timeline['avatar']:
+        avatar_end = min(probe_duration(timeline['avatar']), timeline['duration']) - start
+        fades = ''
+        if is_first:
+            fades += ',fade=t=in:st=0:d=2'
+        if is_last:
+            fades += f',fade=t=out:st={max(avatar_end - 2, 0):.3f}:d=2'
+
+        avatar = graph.add_input(timeline['avatar'], '-ss', f'{start:.3f}', '-t', f'{duration:.3f}')
+        faded, out = graph.label('c'), graph.label('c')
+        resize = f'scale=trunc(iw*{scale / 2})*2:trunc(ih*{scale / 2})*2' if scale != 1 else 'null'
+        graph.add(f'[{avatar}:v]{resize}{fades}[{faded}]')
+        graph.add(f'[{current}][{faded}]overlay=x=W-w:y=0:eof_action=pass[{out}]')
+        current = out
+
+    if timeline['subtitles'] and any(x['end'] > start and x['start'] < start + duration
+                                     for x in timeline['subtitles']):
+        out = graph.label('t')
+        graph.add(f"[{current}]setpts=PTS+{start:.3f}/TB,subtitles=filename='{escape_path(timeline['subtitle_file'])}',"
+                  f"setpts=PTS-STARTPTS[{out}]")
+        current = out
+
+    return current
+
+
+def mix_chain(graph: FilterGraph, timeline: dict) -> str:
+    """
+    Add the audio mix of the timeline, written by mixer_utils.write_audio_tracks, and return the label of its pad.
+    """
+
+    audio = graph.add_input(timeline['mix'])
+    out = graph.label('a')
+    graph.add(f'[{audio}:a]aresample={AUDIO_RATE},aformat=sample_fmts=fltp:channel_layouts=stereo[{out}]')
+    return out
+
+
+def render_timeline(timeline: dict, output: str, script_path: str, profile: dict = None,
+                    renditions: list = None, on_progress: Callable = None) -> str:
+    """
+    Render a whole video timeline with one ffmpeg process.
+
+    Parameters:
+    -----------
+    timeline : dict
+        The timeline of the video, as built by video_utils.collect_timeline.
+    output : str
+        The path of the mp4 file to write.
+    script_path : str
+        The path the filter graph script is written to.
+    profile : dict, optional
+        The render profile, with the output size, fps, preset and crf. Default is the encoder profile of the
+        timeline.
+    renditions : list, optional
+        Extra outputs of the same composition, each one with the 'size' and 'output' keys.
+    on_progress : Callable, optional
+        Called with the number of frames encoded so far.
+
+    Returns:
+    --------
+    str
+        The path of the rendered video.
+
+    Detailed Steps:
+    ---------------
+    1. Scale every scene slot, fade it in and out and concatenate the slots.
+    2. Place the slots on the background and overlay the keyed background on top of them.
+    3. Overlay the avatar video at the top right corner and draw the subtitles.
+    4. Add the audio mix of the dialogue and the background music.
+    5. Concatenate intro and outro around the video and encode everything with libx264 and aac, once for every
+       rendition, from the same composed frames.
+
+    Notes:
+    ------
+    - The layout is composed at the profile size, so smaller profiles keep the same positions with fewer frames
+      and pixels to compose and encode. The renditions are scaled from the composed frames.
+    """
+
+    profile = profile or timeline['encoder']
+    graph = FilterGraph(fps = profile['fps'])
+    composed = compose_chain(graph, timeline, timeline['scenes'], 0, timeline['duration'], profile['size'])
+    graph.add(f'[{composed}]setsar=1,format=yuv420p[main_v]')
+    main_audio = mix_chain(graph, timeline)
+
+    parts = []
+    if timeline['intro']:
+        parts.append(bumper_chain(graph, timeline['intro'], profile['size']))
+
+    parts.append(('main_v', main_audio))
+
+    if timeline['outro']:
+        parts.append(bumper_chain(graph, timeline['outro'], profile['size']))
+
+    if len(parts) > 1:
+        graph.add(f"{''.join(f'[{v}][{a}]' for v, a in parts)}concat=n={len(parts)}:v=1:a=1[out_v][out_a]")
+        video_out, audio_out = 'out_v', 'out_a'
+    else:
+        video_out, audio_out = 'main_v', main_audio
+
+    outputs = [{'size': profile['size'], 'output': output}, *(renditions or [])]
+    videos = split_chain(graph, video_out, [x['size'] for x in outputs], profile['size'])
+    audios = [audio_out] if len(outputs) == 1 else [graph.label('a') for _ in outputs]
+    if len(outputs) > 1:
+        graph.add(f"[{audio_out}]asplit={len(outputs)}{''.join(f'[{x}]' for x in audios)}")
+
+    args = []
+    for item, video_pad, audio_pad in zip(outputs, videos, audios):
+        args += ['-map', f'[{video_pad}]', '-map', f'[{audio_pad}]', *video_codec_args(profile), *AUDIO_CODEC_ARGS,
+                 '-movflags', '+faststart', item['output']]
+
+    run_ffmpeg([*graph.input_args(), '-filter_complex_script', graph.write_script(script_path), *args],
+               on_progress = on_progress)
+
+    return output
+
+
+def split_chain(graph: FilterGraph, video: str, sizes: list, source_size: tuple = OUTPUT_SIZE) -> list:
+    """
+    Split a composed video pad into one pad per size, scaling the pads that need it.
+
+    Parameters:
+    -----------
+    graph : FilterGraph
+        The graph to add the split to.
+    video : str
+        The label of the video pad to split.
+    sizes : list
+        The (width, height) of every output.
+    source_size : tuple, optional
+        The size the pad was composed at. Default is 1920x1080.
+
+    Returns:
+    --------
+    list
+        The labels of the output pads, in the order of sizes.
+    """
+
+    pads = [video] if len(sizes) == 1 else [graph.label('r') for _ in sizes]
+    if len(sizes) > 1:
+        graph.add(f"[{video}]split={len(sizes)}{''.join(f'[{x}]' for x in pads)}")
+
+    outputs = []
+    for pad, size in zip(pads, sizes):
+        if tuple(size) != tuple(source_size):
+            scaled = graph.label('r')
+            graph.add(f'[{pad}]scale={size[0]}:{size[1]}[{scaled}]')
+            pad = scaled
+
+        outputs.append(pad)
+
+    return outputs
+
+
+def transcode_renditions(source: str, renditions: list, profile: dict = None) -> list:
+    """
+    Encode smaller renditions of a rendered video, decoding it only once.
+
+    Parameters:
+    -----------
+    source : str
+        The path of the rendered 1920x1080 video.
+    renditions : list
+        The renditions to write, each one with the 'size' and 'output' keys.
+    profile : dict, optional
+        The render profile the renditions are encoded with. Default is the "final" profile.
+
+    Returns:
+    --------
+    list
+        The paths of the written renditions.
+
+    Notes:
+    ------
+    - The decoded frames are split and scaled once per rendition, the audio is copied to every one of them.
+    """
+
+    graph = FilterGraph()
+    graph.add_input(source)
+    videos = split_chain(graph, '0:v', [x['size'] for x in renditions])
+
+    args = []
+    for item, video_pad in zip(renditions, videos):
+        video_map = video_pad if video_pad == '0:v' else f'[{video_pad}]'
+        args += ['-map', video_map, '-map', '0:a?', *video_codec_args(profile), '-c:a', 'copy', '-movflags',
+                 '+faststart', item['output']]
+
+    filters = ['-filter_complex', ';'.join(graph.filters)] if graph.filters else []
+    run_ffmpeg([*graph.input_args(), *filters, *args])
+    return [x['output'] for x in renditions]
+
+
+def render_segment(timeline: dict, scene: dict, output: str, script_path: str, threads: int = 0) -> str:
+    """
+    Render the video track of a single scene into its own segment.
+
+    Parameters:
+    -----------
+    timeline : dict
+        The timeline of the video.
+    scene : dict
+        The timeline scene to render.
+    output : str
+        The path of the mp4 segment to write.
+    script_path : str
+        The path the filter graph script is written to.
+    threads : int, optional
+        The number of threads of the encoder, 0 lets ffmpeg decide. Default is 0.
+
+    Returns:
+    --------
+    str
+        The path of the rendered segment.
+
+    Notes:
+    ------
+    - Segments have no audio, the whole dialogue track is muxed once when the segments are joined.
+    - The segment length is snapped to the frame grid of the whole timeline, so joined segments never drift
+      from the dialogue.
+    - Static scenes are rendered by render_static_segment, from frames composed once.
+    """
+
+    if is_static_scene(timeline, scene):
+        return render_static_segment(timeline, scene, output, script_path, threads = threads)
+
+    first_frame = round(scene['start'] * OUTPUT_FPS)
+    frames = round((scene['start'] + scene['duration']) * OUTPUT_FPS) - first_frame
+
+    graph = FilterGraph()
+    composed = compose_chain(graph, timeline, [scene], scene['start'], scene['duration'])
+    graph.add(f'[{composed}]tpad=stop_mode=clone:stop_duration=1,trim=end_frame={frames},setpts=PTS-STARTPTS,'
+              f'setsar=1,format=yuv420p[segment]')
+
+    run_ffmpeg([*graph.input_args(), '-filter_complex_script', graph.write_script(script_path),
+                '-map', '[segment]', *video_codec_args(timeline['encoder']), '-threads', threads, '-an', output])
+
+    return output
+
+
+def is_static_scene(timeline: dict, scene: dict) -> bool:
+    """
+    Check if a scene only changes during the fades of its slots.
+
+    Notes:
+    ------
+    - That is a scene of images or blank slots with no avatar over it, that is not the first or the last scene,
+      since those also have the fades of the whole video.
+    """
+
+    end = scene['start'] + scene['duration']
+    return not timeline['avatar'] and scene['start'] > 0 and end < timeline['duration'] - 0.001 and \
+        all(slot['type'] in ('image', 'blank') for slot in scene['slots'])
+
+
+def render_still(timeline: dict, scene: dict, slot: dict, output: str, script_path: str) -> str:
+    """
+    Compose a single frame of a scene slot at full opacity, with the background and the subtitle, to a png file.
+    """
+
+    duration = 1 / OUTPUT_FPS
+    graph = FilterGraph()
+    still = {**scene, 'slots': [{**slot, 'duration': duration, 'still': True}]}
+    composed = compose_chain(graph, timeline, [still], scene['start'], duration)
+    run_ffmpeg([*graph.input_args(), '-filter_complex_script', graph.write_script(script_path),
+                '-map', f'[{composed}]', '-frames:v', 1, output])
+
+    return output
+
+
+def render_static_segment(timeline: dict, scene: dict, output: str, script_path: str, threads: int = 0) -> str:
+    """
+    Render the video track of a static scene from frames composed once, encoding only the frames that change.
+
+    Parameters:
+    -----------
+    timeline : dict
+        The timeline of the video.
+    scene : dict
+        The timeline scene to render, is_static_scene must be true for it.
+    output : str
+        The path of the mp4 segment to write.
+    script_path : str
+        The path the filter graph script is written to.
+    threads : int, optional
+        The number of threads of the encoder, 0 lets ffmpeg decide. Default is 0.
+
+    Returns:
+    --------
+    str
+        The path of the rendered segment.
+
+    Detailed Steps:
+    ---------------
+    1. Compose every slot once at full opacity, and the scene once with a black slot, to png files.
+    2. Cross fade the two frames of every slot with the alpha of the slot fades. Fading the slot from black under
+       the keyed background is the same as cross fading the two composed frames.
+    3. Drop the frames between the fades that repeat the previous one, keeping their timestamps, and encode the
+       segment with a variable frame rate.
+
+    Notes:
+    ------
+    - The first and the last frame of every slot are kept, so the segment lasts exactly as long as the segment
+      render_segment writes and joins with the other segments the same way.
+    """
+
+    first_frame = round(scene['start'] * OUTPUT_FPS)
+    frames = round((scene['start'] + scene['duration']) * OUTPUT_FPS) - first_frame
+    blank = {'type': 'blank', 'file': None, 'duration': 0}
+    stills = [render_still(timeline, scene, slot, f'{script_path[:-4]}_{index}.png', script_path)
+              for index, slot in enumerate([blank, *scene['slots']])]
+
+    graph = FilterGraph()
+    pads = []
+    keep = []
+    elapsed = 0
+    for slot, still in zip(scene['slots'], stills[1:]):
+        first = round(elapsed * OUTPUT_FPS)
+        elapsed += slot['duration']
+        last = min(round(elapsed * OUTPUT_FPS), frames) if slot is not scene['slots'][-1] else frames
+        if last <= first:
+            continue
+
+        length, fade_in, fade_out = last - first, slot['fade_in'], slot['fade_out']
+        keep.append(f'between(n,{first},{first + round(fade_in * OUTPUT_FPS)})+'
+                    f'between(n,{last - round(fade_out * OUTPUT_FPS) - 1},{last - 1})')
+
+        loop = f'loop=loop={length - 1}:size=1:start=0,settb=1/{OUTPUT_FPS},setpts=N'
+        empty, full = graph.add_input(stills[0]), graph.add_input(still)
+        empty_out, full_out, out = graph.label('e'), graph.label('f'), graph.label('s')
+        graph.add(f'[{empty}:v]{loop},format=yuv420p[{empty_out}]')
+        graph.add(f'[{full}:v]{loop},format=yuva420p,fade=t=in:st=0:d={fade_in:.3f}:alpha=1,'
+                  f'fade=t=out:st={length / OUTPUT_FPS - fade_out:.3f}:d={fade_out:.3f}:alpha=1[{full_out}]')
+        graph.add(f'[{empty_out}][{full_out}]overlay=format=auto,format=yuv420p[{out}]')
+        pads.append(f'[{out}]')
+
+    graph.add(f"{''.join(pads)}concat=n={len(pads)}:v=1:a=0,select='{'+'.join(keep)}',setsar=1,"
+              f"format=yuv420p[segment]")
+
+    run_ffmpeg([*graph.input_args(), '-filter_complex_script', graph.write_script(script_path),
+                '-map', '[segment]', *video_codec_args(timeline['encoder'], vfr = True), '-threads', threads, '-an',
+                output])
+
+    for still in stills:
+        os.remove(still)
+
+    return output
+
+
+def normalize_clip(path: str, output: str, profile: dict = None) -> str:
+    """
+    Transcode an intro or outro clip to the codec, size, frame rate and audio rate of the rendered segments.
+
+    Notes:
+    ------
+    - Normalized clips can be joined by stream copy with the segments encoded with the same profile.
+    """
+
+    graph = FilterGraph()
+    video_out, audio_out = bumper_chain(graph, path)
+    run_ffmpeg([*graph.input_args(), '-filter_complex', ';'.join(graph.filters), '-map', f'[{video_out}]',
+                '-map', f'[{audio_out}]', *video_codec_args(profile), *AUDIO_CODEC_ARGS, '-shortest', output])
+
+    return output
+
+
+def bumper_audio_chain(graph: FilterGraph, path: str) -> str:
+    """
+    Add the audio of a normalized intro or outro clip, cut to the length of its video, and return its pad label.
+    """
+
+    index = graph.add_input(path)
+    out = graph.label('a')
+    graph.add(f'[{index}:a]apad,atrim=duration={probe_video_duration(path):.3f}[{out}]')
+    return out
+
+
+def join_segments(timeline: dict, segments: list, output: str, intro: str = None, outro: str = None) -> str:
+    """
+    Join the rendered segments with the concat demuxer and mux the audio of the video under them.
+
+    Parameters:
+    -----------
+    timeline : dict
+        The timeline of the video.
+    segments : list
+        The paths of the scene segments, in timeline order.
+    output : str
+        The path of the mp4 file to write.
+    intro : str, optional
+        The path of the normalized intro clip.
+    outro : str, optional
+        The path of the normalized outro clip.
+
+    Returns:
+    --------
+    str
+        The path of the joined video.
+
+    Notes:
+    ------
+    - The video streams are copied, only the audio (dialogue, music, intro and outro sound) is encoded.
+    """
+
+    clips = [x for x in [intro, *segments, outro] if x]
+    list_path = f'{output[:-4]}_segments.txt'
+    with open(list_path, 'w', encoding = 'utf-8') as file:
+        for clip in clips:
+            file.write("file '{}'\n".format(os.path.abspath(clip).replace('\\', '/').replace("'", "'\\''")))
+
+    graph = FilterGraph()
+    graph.add_input(list_path, '-f', 'concat', '-safe', 0)
+    main_audio = mix_chain(graph, timeline)
+
+    parts = [bumper_audio_chain(graph, intro)] if intro else []
+    parts.append(main_audio)
+    if outro:
+        parts.append(bumper_audio_chain(graph, outro))
+
+    if len(parts) > 1:
+        graph.add(f"{''.join(f'[{x}]' for x in parts)}concat=n={len(parts)}:v=0:a=1[out_a]")
+        audio_map = '[out_a]'
+    else:
+        audio_map = f'[{main_audio}]'
+
+    run_ffmpeg([*graph.input_args(), '-filter_complex', ';'.join(graph.filters), '-map', '0:v',
+                '-map', audio_map, '-c:v', 'copy', *AUDIO_CODEC_ARGS, '-movflags', '+faststart', output])
+
+    return output
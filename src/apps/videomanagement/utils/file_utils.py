@@ -1,4 +1,7 @@
 import os
+import json
+import hashlib
+from functools import lru_cache
 
 
 def generate_directory(name: str, x: int = 0) -> str:
@@ -60,3 +63,44 @@ def check_which_file_exists(images: list) -> str:
             return i
 
     return None
+
+
+@lru_cache(maxsize = 1024)
+def _file_hash(path: str, size: int, modified: int) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+def file_hash(path: str) -> str:
+    """
+    Calculate the sha256 hash of a file's content.
+
+    Parameters:
+    -----------
+    path : str
+        The path of the file.
+
+    Returns:
+    --------
+    str
+        The hex digest of the file content.
+
+    Notes:
+    ------
+    - Hashes are memoized on the path, size and modification time, so a file is only read again after it changes.
+    """
+
+    stat = os.stat(path)
+    return _file_hash(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def fingerprint(data) -> str:
+    """
+    Calculate a deterministic sha256 hash of json serializable data, like the inputs of a render.
+    """
+
+    return hashlib.sha256(json.dumps(data, sort_keys = True, default = str).encode('utf-8')).hexdigest()
@@ -0,0 +1,69 @@
+from .ffmpeg_utils import run_ffmpeg, probe_duration, probe_video_duration, AUDIO_CODEC_ARGS, OUTPUT_FPS
+import math
+import os
+
+
+class HlsPlaylist:
+    """
+    Event hls playlist of a video that grows while the video renders.
+
+    Every part of the video is written as an mpegts segment and added to index.m3u8 as soon as it is ready, so
+    players can start from the first scene while the next ones are still encoding.
+    """
+
+    def __init__(self, folder: str, timeline: dict):
+        self.folder = folder
+        self.elapsed = 0
+        self.count = 0
+
+        os.makedirs(folder, exist_ok = True)
+        for file in os.listdir(folder):
+            os.remove(f'{folder}/{file}')
+
+        self.audio = timeline['mix']
+
+        durations = [scene['duration'] for scene in timeline['scenes']]
+        durations += [probe_duration(timeline[x]) for x in ('intro', 'outro') if timeline[x]]
+        self.lines = ['#EXTM3U', '#EXT-X-VERSION:3', f'#EXT-X-TARGETDURATION:{math.ceil(max(durations)) + 1}',
+                      '#EXT-X-MEDIA-SEQUENCE:0', '#EXT-X-PLAYLIST-TYPE:EVENT']
+        self._write()
+
+    def _write(self) -> None:
+        with open(f'{self.folder}/index.tmp.m3u8', 'w', encoding = 'utf-8') as file:
+            file.write('\n'.join(self.lines) + '\n')
+
+        os.replace(f'{self.folder}/index.tmp.m3u8', f'{self.folder}/index.m3u8')
+
+    def _publish(self, args: list, duration: float) -> None:
+        name = f'{self.count}.ts'
+        run_ffmpeg([*args, '-output_ts_offset', f'{self.elapsed:.3f}', '-f', 'mpegts', f'{self.folder}/{name}'])
+
+        self.lines += [f'#EXTINF:{duration:.3f},', name]
+        self.elapsed += duration
+        self.count += 1
+        self._write()
+
+    def add_clip(self, clip: str) -> None:
+        """
+        Add a normalized clip with its own audio, like the intro or the outro.
+        """
+
+        self._publish(['-i', clip, '-c', 'copy'], probe_video_duration(clip))
+
+    def add_scene(self, scene: dict, segment: str) -> None:
+        """
+        Add a scene segment, with the part of the mixed audio of the video it covers.
+        """
+
+        start = round(scene['start'] * OUTPUT_FPS) / OUTPUT_FPS
+        duration = probe_video_duration(segment)
+        self._publish(['-i', segment, '-ss', f'{start:.3f}', '-t', f'{duration:.3f}', '-i', self.audio,
+                       '-map', '0:v', '-map', '1:a', '-c:v', 'copy', *AUDIO_CODEC_ARGS], duration)
+
+    def finish(self) -> None:
+        """
+        Mark the playlist as complete.
+        """
+
+        self.lines.append('#EXT-X-ENDLIST')
+        self._write()
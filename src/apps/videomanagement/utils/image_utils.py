@@ -0,0 +1,139 @@
+from ..models import Backgrounds
+from .file_utils import file_hash, fingerprint
+from django.conf import settings
+from PIL import Image
+import numpy as np
+import os
+import time
+import uuid
+
+
+def key_background(path: str, color: str, through: int, output: str) -> str:
+    """
+    Make the chroma key color of a background image transparent and save it as an RGBA png.
+
+    Parameters:
+    -----------
+    path : str
+        The file path of the background image.
+    color : str
+        The key color, like "0,163,232".
+    through : int
+        The distance from the key color, in RGB units, under which pixels become transparent.
+    output : str
+        The path of the png file to write.
+
+    Returns:
+    --------
+    str
+        The path of the keyed background.
+
+    Notes:
+    ------
+    - The alpha channel is the same soft mask moviepy's mask_color(thr=through, s=7) calculates for every frame.
+    """
+
+    image = np.asarray(Image.open(path).convert('RGB'))
+    distance = np.sqrt(((image.astype(np.float64) - [int(x) for x in color.split(',')]) ** 2).sum(axis = 2))
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        mask = distance ** 7 / (through ** 7 + distance ** 7)
+
+    alpha = (np.nan_to_num(mask) * 255).round().astype(np.uint8)
+    Image.fromarray(np.dstack([image, alpha]), 'RGBA').save(output)
+    return output
+
+
+def keyed_background(background: Backgrounds) -> str:
+    """
+    Return the keyed RGBA version of a background, creating it the first time it is needed.
+
+    Parameters:
+    -----------
+    background : Backgrounds
+        The background to key.
+
+    Returns:
+    --------
+    str
+        The path of the keyed background png.
+
+    Notes:
+    ------
+    - The keyed file is named after a key of its image, color and through, so changing any of them creates it
+      again on the next render. It is not tracked by a model field, so editing the background never deletes the
+      png a running render reads.
+    """
+
+    key = fingerprint({"file": file_hash(background.file.path), "color": background.color,
+                       "through": background.through})
+
+    output = f'media/other/backgrounds/keyed/{key}.png'
+    if not os.path.exists(output):
+        os.makedirs('media/other/backgrounds/keyed', exist_ok = True)
+        temp = f'media/other/backgrounds/keyed/{key}.{uuid.uuid4().hex}.tmp.png'
+        os.replace(key_background(background.file.path, background.color, background.through, temp), output)
+
+    return output
+
+
+def evict_image_cache(folder: str, max_size: int, min_age: float = 0) -> None:
+    """
+    Delete the least recently used files of the image cache until it fits in max_size bytes.
+
+    Files used in the last min_age seconds are kept even if the cache stays over max_size, since renders that
+    are still running may read them.
+    """
+
+    if not os.path.isdir(folder):
+        return
+
+    files = [entry for entry in os.scandir(folder) if entry.is_file()]
+    total = sum(entry.stat().st_size for entry in files)
+    oldest = time.time() - min_age
+
+    for entry in sorted(files, key = lambda x: x.stat().st_mtime):
+        if total <= max_size or entry.stat().st_mtime > oldest:
+            break
+
+        total -= entry.stat().st_size
+        os.remove(entry.path)
+
+
+def resized_image(path: str, size: tuple) -> str:
+    """
+    Return a copy of an image resized to the given size, resizing it only if there is no cached copy yet.
+
+    Parameters:
+    -----------
+    path : str
+        The file path of the original image.
+    size : tuple
+        The width and height of the resized image.
+
+    Returns:
+    --------
+    str
+        The path of the resized image in the image cache.
+
+    Notes:
+    ------
+    - The original image is never modified.
+    - Cached images are named after the hash of the original and the size, so the same image is resized once
+      for every size, whatever scene or video it belongs to.
+    - Every hit refreshes the modification time of the cached image. The least recently used images are deleted
+      by evict_image_cache before a timeline is collected, never while its paths are in use.
+    """
+
+    folder = settings.IMAGE_CACHE_DIR
+    w, h = int(size[0]), int(size[1])
+    cached = f'{folder}/{file_hash(path)}_{w}x{h}.jpg'
+
+    if os.path.exists(cached):
+        os.utime(cached)
+        return cached
+
+    os.makedirs(folder, exist_ok = True)
+    Image.open(path).convert('RGB').resize((w, h)).save(f'{cached[:-4]}.tmp.jpg', 'JPEG', quality = 95)
+    os.replace(f'{cached[:-4]}.tmp.jpg', cached)
+    return cached
@@ -0,0 +1,71 @@
+from django.conf import settings
+import threading
+import redis
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+RENDER_LEASE = 60
+
+
+class RenderLease:
+    """
+    Hold a lease in redis while a render task runs, so a redelivered copy of the task does not render the same
+    files at the same time.
+
+    Parameters:
+    -----------
+    name : str
+        The name of the lease, like the id of the video the task renders.
+    timeout : int, optional
+        The seconds the lease lasts if it is not renewed. Default is RENDER_LEASE.
+
+    Notes:
+    ------
+    - The lease is renewed every third of its timeout while the task runs, so it never expires under a running
+      render, and it expires at most timeout seconds after a worker dies.
+    - Use it as a context manager, it returns False if another task holds the lease :
+
+        with RenderLease(f"video:{video.id}") as acquired:
+            if not acquired:
+                raise self.retry(countdown = RENDER_LEASE, max_retries = None)
+            ...
+    """
+
+    def __init__(self, name: str, timeout: int = RENDER_LEASE):
+        self.timeout = timeout
+        self.lock = redis.Redis.from_url(settings.CELERY_BROKER_URL).lock(f"render_lease:{name}", timeout = timeout,
+                                                                          thread_local = False)
+        self.acquired = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target = self.renew, daemon = True)
+
+    def renew(self) -> None:
+        while not self.stopped.wait(self.timeout / 3):
+            try:
+                self.lock.reacquire()
+            except redis.exceptions.LockError:
+                logger.error(f"The lease {self.lock.name} expired while its task was running")
+                return
+
+    def __enter__(self) -> bool:
+        self.acquired = self.lock.acquire(blocking = False)
+        if self.acquired:
+            self.thread.start()
+        else:
+            logger.warning(f"The lease {self.lock.name} is held by another task")
+
+        return self.acquired
+
+    def __exit__(self, *_) -> None:
+        if not self.acquired:
+            return
+
+        self.stopped.set()
+        self.thread.join()
+        try:
+            self.lock.release()
+        except redis.exceptions.LockError:
+            pass
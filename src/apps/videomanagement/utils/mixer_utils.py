@@ -0,0 +1,179 @@
+from .ffmpeg_utils import AUDIO_RATE, measure_loudness, probe_duration
+from ..models import Music
+from django.conf import settings
+import numpy as np
+import subprocess
+import math
+import wave
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+CHANNELS = 2
+MUSIC_FADE = 4
+MUSIC_GAIN = 0.07  # The gain of tracks that cannot be measured, like silent ones
+MUSIC_MAX_GAIN = 0.5
+
+
+def decode_audio(path: str, duration: float = None) -> np.ndarray:
+    """
+    Decode an audio file to float samples at the output rate, with ffmpeg.
+
+    Parameters:
+    -----------
+    path : str
+        The path of the audio (or video) file.
+    duration : float, optional
+        Only decode the first seconds of the file.
+
+    Returns:
+    --------
+    np.ndarray
+        The float32 samples, with the shape (frames, 2).
+    """
+
+    limit = ['-t', f'{duration:.3f}'] if duration is not None else []
+    result = subprocess.run([settings.FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', *limit, '-i', path,
+                             '-vn', '-f', 'f32le', '-ac', str(CHANNELS), '-ar', str(AUDIO_RATE), 'pipe:1'],
+                            check = True, capture_output = True)
+
+    return np.frombuffer(result.stdout, dtype = np.float32).reshape(-1, CHANNELS)
+
+
+def write_wav(samples: np.ndarray, output: str) -> str:
+    """
+    Write float samples to a 16 bit stereo wav file at the output rate.
+    """
+
+    pcm = (np.clip(samples, -1, 1) * 32767).astype('<i2')
+    with wave.open(output, 'wb') as file:
+        file.setnchannels(CHANNELS)
+        file.setsampwidth(2)
+        file.setframerate(AUDIO_RATE)
+        file.writeframes(pcm.tobytes())
+
+    return output
+
+
+def dialogue_samples(scenes: list, duration: float) -> np.ndarray:
+    """
+    Assemble the dialogue of every scene into one buffer.
+
+    Parameters:
+    -----------
+    scenes : list
+        The timeline scenes, each with the 'audio' and 'start' keys.
+    duration : float
+        The duration of the timeline, in seconds.
+
+    Returns:
+    --------
+    np.ndarray
+        The samples of the dialogue track.
+
+    Notes:
+    ------
+    - The buffer is allocated once, zeroed, so the padding after the last scene of a section is already silence.
+    - Every dialogue starts at the sample of its scene start, so the track never drifts from the timeline.
+    """
+
+    samples = np.zeros((round(duration * AUDIO_RATE), CHANNELS), dtype = np.float32)
+    for scene in scenes:
+        start = round(scene['start'] * AUDIO_RATE)
+        audio = decode_audio(scene['audio'])[:len(samples) - start]
+        samples[start:start + len(audio)] = audio
+
+    return samples
+
+
+def music_samples(music: dict, length: int) -> np.ndarray:
+    """
+    Decode the background music, cut to the given number of frames, with its gain and fades applied.
+
+    Notes:
+    ------
+    - The fades last the 'fade_in' and 'fade_out' seconds of the plan, MUSIC_FADE by default, and are linear,
+      like the moviepy audio_fadein and audio_fadeout.
+    """
+
+    samples = decode_audio(music['file'], duration = length / AUDIO_RATE)[:length] * music['volume']
+    fade_in = min(round(music['fade_in'] * AUDIO_RATE), len(samples))
+    fade_out = min(round(music['fade_out'] * AUDIO_RATE), len(samples))
+    samples[:fade_in] *= np.linspace(0, 1, fade_in, endpoint = False, dtype = np.float32)[:, None]
+    samples[len(samples) - fade_out:] *= np.linspace(1, 0, fade_out, endpoint = False, dtype = np.float32)[:, None]
+    return samples
+
+
+def write_audio_tracks(timeline: dict) -> dict:
+    """
+    Write the dialogue track and the mix of the dialogue with the background music of a timeline.
+
+    Parameters:
+    -----------
+    timeline : dict
+        The timeline of the video, with the 'audio' and 'mix' output paths.
+
+    Returns:
+    --------
+    dict
+        The timeline.
+
+    Notes:
+    ------
+    - Every dialogue and the music are decoded once, the two files are written from the same buffer.
+    - The dialogue track is also the driving audio of the avatar video, so it has no music.
+    - Without music the mix is the dialogue track itself.
+    """
+
+    samples = dialogue_samples(timeline['scenes'], timeline['duration'])
+    write_wav(samples, timeline['audio'])
+
+    if not timeline['music']:
+        timeline['mix'] = timeline['audio']
+        return timeline
+
+    music = music_samples(timeline['music'], len(samples))
+    samples[:len(music)] += music
+    write_wav(samples, timeline['mix'])
+    return timeline
+
+
+def analyze_music(music: Music) -> Music:
+    """
+    Measure the duration and the loudness of a music track and store them on it, with its normalized gain.
+
+    Parameters:
+    -----------
+    music : Music
+        The music track.
+
+    Returns:
+    --------
+    Music
+        The music track, with the duration, loudness and gain set.
+
+    Notes:
+    ------
+    - The gain brings the track to the MUSIC_LOUDNESS setting, so every track sits at the same level under the
+      dialogue. It is capped at MUSIC_MAX_GAIN so quiet tracks are not amplified into noise.
+    - It is calculated once when the track is downloaded, the mixer only multiplies by it.
+    - Tracks whose loudness cannot be measured, like silent ones or ones ffmpeg fails on, get MUSIC_GAIN. If
+      ffprobe cannot read their duration either, it is left empty and the mixer uses the whole track.
+    """
+
+    try:
+        music.duration = probe_duration(music.file.path)
+        loudness = measure_loudness(music.file.path)
+    except (subprocess.CalledProcessError, ValueError, KeyError) as ex:
+        logger.warning(f"Could not analyze the music {music.name} : {ex}")
+        loudness = -math.inf
+
+    music.loudness = loudness if math.isfinite(loudness) else None
+    music.gain = MUSIC_GAIN if music.loudness is None else \
+        min(10 ** ((settings.MUSIC_LOUDNESS - loudness) / 20), MUSIC_MAX_GAIN)
+    music.save(update_fields = ["duration", "loudness", "gain"])
+
+    logger.info(f"Music {music.name} : {music.loudness} LUFS, gain {music.gain:.3f}")
+    return music
@@ -0,0 +1,127 @@
+from ..models import Videos, VideoStageProfile
+from typing import Union
+import threading
+import psutil
+import time
+import os
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+def process_rss(process: psutil.Process) -> int:
+    """
+    Return the resident memory of a process and of all its children, like the ffmpeg processes of a render.
+    """
+
+    rss = process.memory_info().rss
+    for child in process.children(recursive = True):
+        try:
+            rss += child.memory_info().rss
+        except psutil.Error:
+            pass
+
+    return rss
+
+
+def folder_bytes(folder: str, since: float) -> int:
+    """
+    Return the size of the files of a folder that were written after the given timestamp.
+    """
+
+    total = 0
+    for root, _, files in os.walk(folder):
+        for file in files:
+            try:
+                stat = os.stat(os.path.join(root, file))
+            except OSError:
+                continue
+
+            if stat.st_mtime >= since:
+                total += stat.st_size
+
+    return total
+
+
+class StageProfiler:
+    """
+    Measure the wall time, cpu time, peak memory and bytes written of a pipeline stage.
+
+    Parameters:
+    -----------
+    stage : str
+        The name of the stage, like "llm", "tts", "images", "avatar" or "encoding".
+    video : Videos, optional
+        The video the stage runs for. If given the profile is saved on it when the stage ends without error,
+        otherwise it can be saved later with save.
+    folder : str, optional
+        The folder the stage writes to. Default is the dir_name of the video.
+    interval : float, optional
+        The seconds between two memory samples. Default is 0.2.
+
+    Notes:
+    ------
+    - The cpu time and the memory include the child processes of the stage, like ffmpeg and SadTalker.
+    - The bytes written are the size of the files of the folder that were created or modified during the stage.
+    - Use it as a context manager :
+
+        with StageProfiler("encoding", video = video):
+            ...
+    """
+
+    def __init__(self, stage: str, video: Videos = None, folder: str = None, interval: float = 0.2):
+        self.stage = stage
+        self.video = video
+        self.folder = folder or (video.dir_name if video else None)
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak_rss = 0
+        self.stopped = threading.Event()
+        self.sampler = None
+        self.result = None
+
+    def sample(self) -> None:
+        while True:
+            try:
+                self.peak_rss = max(self.peak_rss, process_rss(self.process))
+            except psutil.Error:
+                pass
+
+            if self.stopped.wait(self.interval):
+                return
+
+    def __enter__(self) -> "StageProfiler":
+        self.started = time.time()
+        self.wall = time.perf_counter()
+        self.cpu = os.times()
+        self.sampler = threading.Thread(target = self.sample, daemon = True)
+        self.sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.stopped.set()
+        self.sampler.join()
+
+        cpu = os.times()
+        self.result = {
+            "stage": self.stage,
+            "wall_time": round(time.perf_counter() - self.wall, 3),
+            "cpu_time": round(sum(cpu[:4]) - sum(self.cpu[:4]), 3),
+            "peak_rss": self.peak_rss,
+            "bytes_written": folder_bytes(self.folder, self.started) if self.folder else 0,
+        }
+
+        if exc_type is None and self.video:
+            self.save(self.video)
+
+    def save(self, video: Videos) -> Union[VideoStageProfile, None]:
+        """
+        Save the profile of the finished stage on the video.
+        """
+
+        if self.result is None:
+            return None
+
+        logger.info(f"Stage {self.stage} of the video with id : {video.id} took {self.result['wall_time']}s")
+        return VideoStageProfile.objects.create(video = video, **self.result)
@@ -0,0 +1,139 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from proglog import ProgressBarLogger
+from typing import Union
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+def progress_group(video_id: int) -> str:
+    """
+    Return the name of the channel layer group that receives the progress events of a video.
+    """
+
+    return f"video_{video_id}_progress"
+
+
+def send_progress(video_id: int, event: dict) -> None:
+    """
+    Send a progress event to the websocket group of a video.
+
+    Parameters:
+    -----------
+    video_id : int
+        The id of the video.
+    event : dict
+        The progress event, with the 'stage', 'scene', 'scenes', 'frames', 'total_frames' and 'eta' keys.
+
+    Returns:
+    --------
+    None
+
+    Notes:
+    ------
+    - Progress is best effort, if the channel layer is not configured or not reachable the event is dropped and
+      the render goes on.
+    """
+
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    try:
+        async_to_sync(channel_layer.group_send)(progress_group(video_id), {"type": "render.progress",
+                                                                          "progress": event})
+    except Exception as ex:
+        logger.warning(f"Could not send the progress of the video with id : {video_id} : {ex}")
+
+
+class Progress:
+    """
+    Report the progress of one stage of a video, with an ETA estimated from the elapsed time.
+
+    Parameters:
+    -----------
+    video_id : int
+        The id of the video, nothing is sent if it is None.
+    stage : str
+        The name of the stage, like "speech", "images", "avatar" or "encoding".
+    scenes : int, optional
+        The number of scenes of the stage.
+    total_frames : int, optional
+        The number of frames the stage encodes.
+    interval : float, optional
+        The minimum number of seconds between two frame updates. Default is 0.5.
+    """
+
+    def __init__(self, video_id: Union[int, None], stage: str, scenes: int = None, total_frames: int = None,
+                 interval: float = 0.5):
+        self.video_id = video_id
+        self.stage = stage
+        self.scenes = scenes
+        self.total_frames = total_frames
+        self.interval = interval
+        self.started = time.monotonic()
+        self.sent = 0
+        self.scene = None
+        self.frames = None
+
+    def eta(self) -> Union[float, None]:
+        """
+        Estimate the seconds left from the share of frames, or else of scenes, done so far.
+        """
+
+        if self.frames and self.total_frames:
+            done = self.frames / self.total_frames
+        elif self.scene is not None and self.scenes:
+            done = (self.scene + 1) / self.scenes
+        else:
+            return None
+
+        return round((time.monotonic() - self.started) * (1 - done) / done, 1) if done < 1 else 0
+
+    def update(self, scene: int = None, frames: int = None, force: bool = False) -> None:
+        """
+        Record the index of the scene done last and the frames encoded so far, and send them.
+
+        Frame updates are sent at most once every interval seconds, scene updates always.
+        """
+
+        self.scene = scene if scene is not None else self.scene
+        self.frames = frames if frames is not None else self.frames
+
+        now = time.monotonic()
+        if self.video_id is None or (scene is None and not force and now - self.sent < self.interval):
+            return
+
+        self.sent = now
+        send_progress(self.video_id, {"stage": self.stage, "scene": self.scene, "scenes": self.scenes,
+                                      "frames": self.frames, "total_frames": self.total_frames, "eta": self.eta()})
+
+    def encoded(self, frames: int) -> None:
+        self.update(frames = frames)
+
+    def start(self) -> "Progress":
+        self.update(force = True)
+        return self
+
+    def finish(self) -> None:
+        self.frames = self.total_frames if self.total_frames else self.frames
+        self.scene = self.scenes - 1 if self.scenes else self.scene
+        self.update(force = True)
+
+
+class MoviepyProgress(ProgressBarLogger):
+    """
+    Forward the frame counter of moviepy's write_videofile to a Progress.
+    """
+
+    def __init__(self, progress: Progress):
+        super().__init__()
+        self.progress = progress
+
+    def bars_callback(self, bar, attr, value, old_value = None):
+        if bar == "t" and attr == "index":
+            self.progress.total_frames = self.bars[bar]["total"]
+            self.progress.update(frames = value)
@@ -0,0 +1,84 @@
+from .ffmpeg_utils import OUTPUT_SIZE
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+SUBTITLE_FADE = 1
+SUBTITLE_STYLE = "Style: Default,Arial,37,&H00FF0000,&H00FF0000,&H00000000,&H00000000,0,0,0,0,100,100,0,0,1,0,0,2," \
+                 "60,260,70,1"
+
+
+def ass_time(seconds: float) -> str:
+    """
+    Format seconds as an ASS timestamp, H:MM:SS.cc.
+    """
+
+    centiseconds = max(round(seconds * 100), 0)
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    return f"{hours}:{minutes:02d}:{centiseconds // 100:02d}.{centiseconds % 100:02d}"
+
+
+def ass_text(text: str) -> str:
+    """
+    Escape a scene text for an ASS dialogue line, so braces and backslashes are not read as override tags.
+    """
+
+    return " ".join(text.replace("\\", "/").replace("{", "(").replace("}", ")").split())
+
+
+def write_ass(subtitles: list, output: str, duration: float, offset: float = 0) -> str:
+    """
+    Write the subtitle track of a timeline to a single ASS document.
+
+    Parameters:
+    -----------
+    subtitles : list
+        The timeline subtitles, each one with its 'text', 'start' and 'end'.
+    output : str
+        The path of the .ass file.
+    duration : float
+        The duration of the timeline, in seconds.
+    offset : float, optional
+        The seconds the subtitles are shifted by, like the duration of an intro played before the timeline.
+        Default is 0.
+
+    Returns:
+    --------
+    str
+        The path of the .ass file.
+
+    Notes:
+    ------
+    - The style matches the captions the video always had : blue, 37px, centered at the bottom, wrapped by
+      libass at 1600px.
+    - The first subtitle fades in and the last one fades out with the video, for SUBTITLE_FADE seconds.
+    - The document is burnt in by the subtitles filter while the video is encoded, so the text is rasterized once
+      per line instead of once per frame.
+    """
+
+    w, h = OUTPUT_SIZE
+    lines = ["[Script Info]", "ScriptType: v4.00+", f"PlayResX: {w}", f"PlayResY: {h}", "WrapStyle: 0", "",
+             "[V4+ Styles]",
+             "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, "
+             "Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, "
+             "MarginL, MarginR, MarginV, Encoding",
+             SUBTITLE_STYLE, "",
+             "[Events]",
+             "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text"]
+
+    fade = SUBTITLE_FADE * 1000
+    for subtitle in subtitles:
+        fade_in = fade if subtitle["start"] == 0 else 0
+        fade_out = fade if subtitle["end"] >= duration - 0.001 else 0
+        tags = f"{{\\fad({fade_in},{fade_out})}}" if fade_in or fade_out else ""
+        lines.append(f"Dialogue: 0,{ass_time(subtitle['start'] + offset)},{ass_time(subtitle['end'] + offset)},"
+                     f"Default,,0,0,0,,{tags}{ass_text(subtitle['text'])}")
+
+    with open(output, "w", encoding = "utf-8") as file:
+        file.write("\n".join(lines) + "\n")
+
+    logger.info(f"Wrote {len(subtitles)} subtitles to {output}")
+    return output
@@ -1,12 +1,34 @@
-from moviepy.editor import AudioFileClip, concatenate_audioclips, CompositeAudioClip, ImageClip, VideoFileClip, vfx,\
-    concatenate_videoclips, CompositeVideoClip, TextClip
+from moviepy.editor import AudioFileClip, VideoFileClip, concatenate_videoclips
 from ..models import *
 from PIL import Image
-import subprocess
-import shlex
 import os
 from .SadTalker.inference import lip
+from .ffmpeg_utils import probe_duration, probe_video_duration, render_timeline, \
+    render_segment, normalize_clip, join_segments, transcode_renditions, video_codec_args, run_ffmpeg, even, \
+    escape_path, probe, drawtext_filters, encoder_args, encoder_profile, OUTPUT_FPS, OUTPUT_SIZE, AUDIO_CODEC_ARGS, \
+    RENDER_PROFILES, ENCODER_PROFILES, RENDITIONS, AVATAR_SCALE, MP4_VIDEO_CODECS, AUDIO_COPY_FORMATS
+from typing import Union
+from .file_utils import file_hash, fingerprint
+from .image_utils import keyed_background, resized_image, evict_image_cache
+from django.conf import settings
+from .hls_utils import HlsPlaylist
+from .progress_utils import Progress, MoviepyProgress
+from .compositor_utils import StreamingCompositor
+from .mixer_utils import write_audio_tracks, analyze_music, MUSIC_FADE
+from .profile_utils import StageProfiler
+from .subtitle_utils import write_ass
+from .checkpoint_utils import RenderManifest
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
 import uuid
+import subprocess
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+TEXT_OVERLAY = {"fontsize": 50, "fontcolor": "blue", "x": 500, "y": 500, "start": None, "end": None}
 
 
 def check_if_image(path: str) -> bool:
@@ -61,7 +83,7 @@ def check_if_video(path: str) -> bool:
     return False
 
 
-def make_video(video: Videos, subtitle: bool = False) -> Videos:
+def make_video(video: Videos, subtitle: bool = False, backend: str = None, renditions: list = None) -> Videos:
     """
     Create a composite video based on provided video object and optional subtitles.
 
@@ -71,6 +93,10 @@ def make_video(video: Videos, subtitle: bool = False) -> Videos:
         An instance of the Videos class containing video details, including prompts, background, music, intro, and outro.
     subtitle : bool, optional
         A flag indicating whether to include subtitles in the video. Default is False.
+    backend : str, optional
+        The render backend, "moviepy" or "ffmpeg". Default is the RENDER_BACKEND setting.
+    renditions : list, optional
+        The names of the extra renditions to write, like "720p". Default is the RENDER_RENDITIONS setting.
 
     Returns:
     --------
@@ -79,149 +105,896 @@ def make_video(video: Videos, subtitle: bool = False) -> Videos:
 
     Detailed Steps:
     ---------------
-    1. Load silent audio and black image files as defaults.
-    2. Retrieve sound scenes associated with the video's prompt and background image (if available).
-    3. Initialize lists to store audio clips, video clips, and subtitles.
-    4. Process each sound scene:
-        a. Create an audio clip and append to the sound list.
-        b. Generate subtitles if the subtitle flag is True and append to the subtitles list.
-        c. Retrieve associated scene images or videos, resize if necessary, and append to the video clips list.
-    5. Concatenate video clips and apply margins or set position based on background availability.
-    6. Concatenate audio clips and optionally overlay background music.
-    7. Combine video and audio clips, applying masks, fades, and resizing as required.
-    8. Optionally, add an avatar video overlay.
-    9. Add subtitles if the subtitle flag is True.
-    10. Prepend intro and append outro videos if available.
-    11. Write the final composite video to the output path and close all resources.
-    12. Update the video object with the output file path and status, then save.
+    1. Collect the timeline of the video and write its dialogue track and its mix with the music, see mixer_utils.
+    2. Create the avatar video, if the video has an avatar and it is not checkpointed yet.
+    3. Set up a StreamingCompositor for the scenes, with the keyed background, fades and avatar. The subtitles
+       are burnt in from the ASS document by the encoder.
+    4. Prepend intro and append outro videos if available.
+    5. Write the final composite video with the audio mix and the encoder profile of the timeline, reporting the
+       frames encoded, and close all resources.
+    6. Encode the extra renditions from the output video.
+    7. Update the video object with the output file path and status, then save.
 
     Notes:
     ------
-    - Requires presence of certain assets (e.g., silent audio file, black image) at specified paths.
+    - Requires presence of certain assets (e.g., black image) at specified paths.
+    - The scene sources are opened window by window while the video is written, so the memory used does not grow
+      with the number of scenes, see compositor_utils.
     - Uses various external libraries such as moviepy for video/audio processing and PIL for image manipulation.
+    - With the "ffmpeg" backend the same timeline is rendered by make_video_ffmpeg instead.
+    - The progress of every stage is sent to the websocket group of the video, see progress_utils.
+    - The timeline, audio, avatar, encoding and renditions stages are profiled and the profiles saved on the
+      video. The frames are composed while they are encoded, so compositing is part of the encoding stage.
+    - If the render_fingerprint of the inputs matches the one of the existing output, the video is returned as
+      it is, without rendering it again. Otherwise the render key is cleared before anything is written, so an
+      output a failed render left half written is never taken for a finished one.
     """
 
-    silent = AudioFileClip(r'assets\blank.wav')
-    black = ImageClip(r'assets\black.jpg')
-    sounds = Scene.objects.filter(prompt = video.prompt)
-    background = video.background
+    key = render_fingerprint(video, subtitle = subtitle, backend = backend, renditions = renditions)
+    if is_rendered(video, key, renditions):
+        logger.info(f"The video with id : {video.id} did not change since its last render")
+        video.status = "COMPLETED"
+        video.save(update_fields = ["status"])
+        Progress(video.id, "completed").start()
+        return video
 
-    if background:
-        clip = ImageClip(background.file.path)
-        w, h = clip.size
+    video.render_key = ""
+    video.save(update_fields = ["render_key"])
+
+    if (backend or settings.RENDER_BACKEND) == "ffmpeg":
+        video = make_video_ffmpeg(video, subtitle = subtitle, renditions = renditions)
+        video.render_key = key
+        video.save(update_fields = ["render_key"])
+        return video
+
+    timeline = resume_timeline(video, subtitle = subtitle)
+    final_audio = AudioFileClip(timeline["mix"])
+    compositor = StreamingCompositor(timeline)
+    final_video = compositor.clip().set_audio(final_audio)
+
+    if video.intro:
+        intro = VideoFileClip(video.intro.file.path)
+        final_video = concatenate_videoclips([intro, final_video], method='compose')
+
+    if video.outro:
+        outro = VideoFileClip(video.outro.file.path)
+        final_video = concatenate_videoclips([final_video, outro], method='compose')
+
+    filters = []
+    if timeline["subtitles"]:
+        subtitle_file = timeline["subtitle_file"] if not video.intro else \
+            write_ass(timeline["subtitles"], f"{video.dir_name}/subtitles_intro.ass", timeline["duration"],
+                      offset = intro.duration)
+        filters.append(f"subtitles=filename='{escape_path(subtitle_file)}'")
+
+    # moviepy passes ffmpeg_params to the command as they are, so they must be strings
+    ffmpeg_params = [str(x) for x in encoder_args(timeline["encoder"])]
+    if filters:
+        ffmpeg_params += ["-vf", ",".join(filters)]
+
+    progress = Progress(video.id, "encoding").start()
+    with StageProfiler("encoding", video = video):
+        final_video.write_videofile(rf"{video.dir_name}\output_video.mp4", fps = 24, threads = 8,
+                                    preset = timeline["encoder"]["preset"], ffmpeg_params = ffmpeg_params,
+                                    logger = MoviepyProgress(progress))
+    progress.finish()
+
+    compositor.close()
+    final_audio.close()
+
+    outputs = rendition_outputs(video, renditions)
+    if outputs:
+        with StageProfiler("renditions", video = video):
+            transcode_renditions(rf"{video.dir_name}\output_video.mp4", outputs, profile = timeline["encoder"])
+
+    save_renditions(video, outputs)
+
+    video.output = rf"{video.dir_name}\output_video.mp4"
+    video.status = "COMPLETED"
+    video.render_key = key
+    video.save()
+    Progress(video.id, "completed").start()
+    return video
+
+
+def render_fingerprint(video: Videos, subtitle: bool = False, backend: str = None, renditions: list = None) -> str:
+    """
+    Calculate a deterministic fingerprint of everything the output of a render depends on.
+
+    Parameters:
+    -----------
+    video : Videos
+        The video to render.
+    subtitle : bool, optional
+        A flag indicating whether the render includes subtitles. Default is False.
+    backend : str, optional
+        The render backend. Default is the RENDER_BACKEND setting.
+    renditions : list, optional
+        The names of the extra renditions. Default is the RENDER_RENDITIONS setting.
+
+    Returns:
+    --------
+    str
+        The fingerprint of the render inputs.
 
-    sound_list = []
-    vids = []
-    subtitles = []
-    for sound in sounds:
-        audio = AudioFileClip(sound.file.path)
-        if sound.is_last:
-            audio = concatenate_audioclips([audio, silent, silent])
+    Notes:
+    ------
+    - It covers the content of the scene audios and images, the background and its keying settings, the music
+      and its gain, the avatar image, the intro and outro, and the render settings, including whether the render
+      is segmented and published as hls.
+    - Files are hashed by content, with the memoized file_hash, so no file is read twice while it is unchanged.
+    - Music that was never analyzed is analyzed first, so the key has the gain the render mixes it with.
+    """
 
-        sound_list.append(audio)
-        if subtitle:
-            sub = TextClip(sound.text, fontsize = 37, color = 'blue', method = "caption", size = (1600, 500)).\
-                set_duration(audio.duration)
+    if video.music and video.music.gain is None:
+        analyze_music(video.music)
 
-            subtitles.append(sub)
+    background = video.background
+    scenes = []
+    for sound in Scene.objects.filter(prompt = video.prompt).order_by("id"):
+        scenes.append({"audio": file_hash(sound.file.path), "is_last": sound.is_last,
+                       "text": sound.text if subtitle else None,
+                       "images": [file_hash(x.file.path) if x.file and os.path.exists(x.file.path) else None
+                                  for x in SceneImage.objects.filter(scene = sound)]})
+
+    return fingerprint({
+        "scenes": scenes,
+        "background": {"file": file_hash(background.file.path), "color": background.color,
+                       "through": background.through, "top": background.image_pos_top,
+                       "left": background.image_pos_left} if background else None,
+        "music": {"file": file_hash(video.music.file.path), "gain": video.music.gain} if video.music else None,
+        "avatar": file_hash(video.avatar.file.path) if video.avatar else None,
+        "intro": file_hash(video.intro.file.path) if video.intro else None,
+        "outro": file_hash(video.outro.file.path) if video.outro else None,
+        "settings": {"backend": backend or settings.RENDER_BACKEND, "subtitle": subtitle,
+                     "renditions": sorted(settings.RENDER_RENDITIONS if renditions is None else renditions),
+                     "profile": RENDER_PROFILES["final"], "size": OUTPUT_SIZE, "fps": OUTPUT_FPS,
+                     "encoder": encoder_profile_name(video), "encoders": ENCODER_PROFILES,
+                     "segments": settings.RENDER_SEGMENTS, "hls": settings.RENDER_HLS},
+    })
+
+
+def is_rendered(video: Videos, key: str, renditions: list = None) -> bool:
+    """
+    Check if the video output, and every requested rendition of it, was rendered from the inputs of the key.
 
-        scenes = SceneImage.objects.filter(scene = sound)
+    The render key is only set when a render completes and is cleared when the next one starts, so a key that
+    matches always belongs to a finished output.
+    """
 
-        if scenes.count() > 0:
-            for x in scenes:
-                if x.file and check_if_image(x.file.path):
-                    if background:
-                        Image.open(x.file.path).convert('RGB').resize((int(w*0.65), int(h*0.65))).save(x.file.path)
-                    try:
-                        image = ImageClip(x.file.path)
-                        image = image.set_duration(audio.duration/len(scenes))
+    if video.status == "FAILED" or video.render_key != key or not video.output or \
+            not os.path.exists(video.output.path):
+        return False
 
-                        image = image.fadein(image.duration*0.2).\
-                            fadeout(image.duration*0.2)
-                    except ValueError:
-                        image = black.set_duration(audio.duration)
+    return all(os.path.exists(x["output"]) for x in rendition_outputs(video, renditions))
 
-                    vids.append(image)
 
-                elif x.file and check_if_video(x.file.path):
+def encoder_profile_name(video: Videos) -> str:
+    """
+    Return the encoder profile selected for a video : its own, else the one of its template, else the
+    RENDER_ENCODER_PROFILE setting.
+    """
 
-                    vid_scene = VideoFileClip(x.file.path).without_audio()
-                    if vid_scene.duration >= audio.duration:
-                        vid_scene = vid_scene.subclip(0, audio.duration)
+    template = video.prompt.template
+    return video.encoder_profile or (template.encoder_profile if template else None) or \
+        settings.RENDER_ENCODER_PROFILE
 
-                    vid_scene = vid_scene.fadein(audio.duration*0.2).fadeout(audio.duration*0.2)
-                    vids.append(vid_scene)
 
-                else:
-                    vids.append(black.set_duration(audio.duration))
-        else:
-            vids.append(black.set_duration(audio.duration))
+def plan_timeline(video: Videos, subtitle: bool = False) -> dict:
+    """
+    Plan the timeline of a video from its scenes and scene images, without creating any file.
 
+    Parameters:
+    -----------
+    video : Videos
+        The video to plan.
+    subtitle : bool, optional
+        A flag indicating whether to plan the subtitle track. Default is False.
+
+    Returns:
+    --------
+    dict
+        The serializable plan, with the scenes and their image slots, the background, the music window, the
+        avatar and subtitle tracks, the intro and outro and the encoder profile of the output.
+
+    Notes:
+    ------
+    - Every scene lasts as long as its dialogue, plus 2 seconds of silence when it is the last of its section.
+    - The scene images share the scene duration equally, scenes without images get a black slot. Images and
+      videos fade in and out for the 20% of their slot.
+    - The background and the avatar fade in and out for 2 seconds at the start and the end of the video.
+    - The music is played at its normalized gain. The plan only reads the stored duration and gain, they are
+      None for tracks that were never analyzed, collect_timeline analyzes them.
+    - The encoder profile is picked from the makeup of the plan when it is "auto", see ffmpeg_utils.encoder_profile.
+    - Only the dialogue durations are probed, so planning is cheap. collect_timeline turns the plan into the
+      timeline the render backends use.
+    """
+
+    background = video.background
     if background:
-        final_video = concatenate_videoclips(vids).margin(top=background.image_pos_top,
-                                                          left = background.image_pos_left,
-                                                          opacity=4)
+        w, h = Image.open(background.file.path).size
+        slot_size = (even(w*0.65), even(h*0.65))
     else:
-        final_video = concatenate_videoclips(vids).set_position('center')
+        slot_size = OUTPUT_SIZE
+
+    scenes = []
+    start = 0
+    for sound in Scene.objects.filter(prompt = video.prompt):
+        padding = 2 if sound.is_last else 0
+        duration = probe_duration(sound.file.path) + padding
+        scene_images = SceneImage.objects.filter(scene = sound)
+
+        slots = []
+        for index, x in enumerate(scene_images):
+            slot = {"type": "blank", "source": None, "start": start + index * duration / len(scene_images),
+                    "duration": duration / len(scene_images), "fade_in": 0, "fade_out": 0}
 
-    final_audio = concatenate_audioclips(sound_list)
-    final_audio.write_audiofile(rf"{video.dir_name}\output_audio.wav")
+            if x.file and (check_if_image(x.file.path) or check_if_video(x.file.path)):
+                slot.update({"type": "image" if check_if_image(x.file.path) else "video", "source": x.file.path,
+                             "fade_in": slot["duration"] * 0.2, "fade_out": slot["duration"] * 0.2})
+
+            slots.append(slot)
+
+        if not slots:
+            slots.append({"type": "blank", "source": None, "start": start, "duration": duration, "fade_in": 0,
+                          "fade_out": 0})
+
+        scenes.append({"id": sound.id, "audio": sound.file.path, "text": sound.text, "padding": padding,
+                       "start": start, "end": start + duration, "duration": duration, "slots": slots})
+        start += duration
+
+    plan = {"scenes": scenes, "duration": start, "audio": f"{video.dir_name}/output_audio.wav",
+            "mix": f"{video.dir_name}/output_mix.wav",
+            "background": None, "avatar": None, "avatar_track": None, "subtitles": [], "music": None,
+            "intro": video.intro.file.path if video.intro else None,
+            "outro": video.outro.file.path if video.outro else None}
+
+    if background:
+        plan["background"] = {"source": background.file.path, "top": background.image_pos_top,
+                              "left": background.image_pos_left, "slot_size": slot_size, "fade_in": 2,
+                              "fade_out": 2}
+
+    if video.avatar:
+        plan["avatar_track"] = {"source": video.avatar.file.path, "start": 0, "end": start, "position": "top right",
+                                "scale": AVATAR_SCALE, "fade_in": 2, "fade_out": 2}
 
     if video.music:
-        music = AudioFileClip(video.music.file.path).volumex(0.07)
-        music = music.subclip(0, final_audio.duration) if music.duration > final_audio.duration else music
-        music = music.audio_fadein(4).audio_fadeout(4)
-        final_audio = CompositeAudioClip([final_audio, music])
+        plan["music"] = music_window(video.music, start)
+
+    if subtitle:
+        plan["subtitles"] = [{"text": scene["text"], "start": scene["start"], "end": scene["end"]}
+                             for scene in scenes]
+
+    plan["encoder"] = encoder_profile(encoder_profile_name(video), plan)
+
+    return plan
+
+
+def music_window(music: Music, duration: float) -> dict:
+    """
+    Return the window of the timeline the music is played in, from the stored duration and gain of the track.
+    """
+
+    end = duration if music.duration is None else min(music.duration, duration)
+    return {"file": music.file.path, "duration": music.duration, "volume": music.gain, "start": 0, "end": end,
+            "fade_in": MUSIC_FADE, "fade_out": MUSIC_FADE}
+
+
+def collect_timeline(video: Videos, subtitle: bool = False) -> dict:
+    """
+    Plan the timeline of a video and prepare the files the render backends read.
+
+    Parameters:
+    -----------
+    video : Videos
+        The video whose timeline is collected.
+    subtitle : bool, optional
+        A flag indicating whether to write the subtitle document. Default is False.
+
+    Returns:
+    --------
+    dict
+        The plan_timeline plan, with the 'file' of the background and of every slot, and the 'subtitle_file' ASS
+        document of the subtitles.
+
+    Notes:
+    ------
+    - The background file is its keyed png.
+    - Music tracks that were never analyzed are analyzed once here, see mixer_utils.analyze_music.
+    - Image slots point to a cached copy of the image already resized to the slot size. The image cache is
+      trimmed before the copies are made, images used in the last IMAGE_CACHE_MIN_AGE seconds are kept for the
+      renders that may still be reading them.
+    """
+
+    evict_image_cache(settings.IMAGE_CACHE_DIR, settings.IMAGE_CACHE_MAX_SIZE, settings.IMAGE_CACHE_MIN_AGE)
+    timeline = plan_timeline(video, subtitle = subtitle)
+    background = timeline["background"]
+    slot_size = background["slot_size"] if background else OUTPUT_SIZE
+
+    if timeline["music"] and timeline["music"]["volume"] is None:
+        timeline["music"] = music_window(analyze_music(video.music), timeline["duration"])
 
     if background:
-        clip = clip.set_duration(final_audio.duration).set_audio(final_audio)
+        background["file"] = keyed_background(video.background)
 
-        color = [int(x) for x in background.color.split(',')]
+    for scene in timeline["scenes"]:
+        for slot in scene["slots"]:
+            slot["file"] = resized_image(slot["source"], slot_size) if slot["type"] == "image" else slot["source"]
 
-        masked_clip = clip.fx(vfx.mask_color, color = color, thr = background.through, s = 7)
+    if timeline["subtitles"]:
+        timeline["subtitle_file"] = write_ass(timeline["subtitles"], f"{video.dir_name}/subtitles.ass",
+                                              timeline["duration"])
+    return timeline
 
-        final_video = CompositeVideoClip([final_video,
-                                         masked_clip.set_duration(final_audio.duration)],
-                                         size = (1920, 1080)).fadein(2).fadeout(2)
 
-    else:
-        final_video = final_video.set_audio(final_audio).resize((1920, 1080))
+def prepare_timeline(video: Videos, subtitle: bool = False) -> dict:
+    """
+    Collect the timeline of a video with its audio and avatar files and the intro and outro mezzanines, for the
+    segmented renders.
+
+    Parameters:
+    -----------
+    video : Videos
+        The video to render.
+    subtitle : bool, optional
+        A flag indicating whether to include subtitles in the video. Default is False.
+
+    Returns:
+    --------
+    dict
+        The timeline of the video, with the path of the avatar video if it has one.
+
+    Detailed Steps:
+    ---------------
+    1. Collect the timeline of the video with its audio tracks and avatar video, see resume_timeline.
+    2. Get the mezzanine files of the intro and outro, the segmented renders join them by stream copy.
+    """
+
+    timeline = resume_timeline(video, subtitle = subtitle)
+    timeline["mezzanines"] = {name: mezzanine_file(bumper, timeline["encoder"]) for name, bumper in
+                              (("intro", video.intro), ("outro", video.outro)) if bumper}
+    return timeline
+
+
+def resume_timeline(video: Videos, subtitle: bool = False) -> dict:
+    """
+    Collect the timeline of a video and create its audio tracks and avatar video, or resume them from the render
+    manifest.
+
+    Parameters:
+    -----------
+    video : Videos
+        The video to render.
+    subtitle : bool, optional
+        A flag indicating whether to include subtitles in the video. Default is False.
+
+    Returns:
+    --------
+    dict
+        The timeline of the video, with the path of its mix and of the avatar video if it has one.
+
+    Detailed Steps:
+    ---------------
+    1. Collect the timeline of the video.
+    2. Write the dialogue track to output_audio.wav and its mix with the music to output_mix.wav.
+    3. Create the avatar video from the dialogue track, if the video has an avatar.
+
+    Notes:
+    ------
+    - Step 1 is profiled as the "timeline" stage (keying and resizing the images), step 2 as the "audio" stage
+      and step 3 as the "avatar" stage. The frames are composed while they are encoded, in the "encoding" stage.
+    - The audio tracks and the avatar video are checkpointed in the render manifest of the video, so a retried
+      render reuses them if their inputs did not change.
+    """
+
+    manifest = RenderManifest(video.dir_name)
+    with StageProfiler("timeline", video = video):
+        timeline = collect_timeline(video, subtitle = subtitle)
+
+    with StageProfiler("audio", video = video):
+        resume_audio_tracks(timeline, manifest)
 
     if video.avatar:
-        avatar_video = rf'{os.getcwd()}\{video.dir_name}\output_avatar.mp4'
-        if not os.path.exists(rf'{os.getcwd()}\{video.dir_name}\output_avatar.mp4'):
-            avatar_video = create_avatar_video(video.avatar, video.dir_name)
-        avatar_vid = VideoFileClip(avatar_video).without_audio().set_position(("right", "top")).resize(1.5).\
-            fadein(2).fadeout(2)
-        final_video = CompositeVideoClip([final_video, avatar_vid], size = (1920, 1080))
+        timeline["avatar"] = resume_avatar_video(video, timeline, manifest)
 
-    if subtitle:
-        subs = concatenate_videoclips(subtitles)
-        final_video = CompositeVideoClip([final_video, subs.set_pos((60, 760)).fadein(1).fadeout(1)])
+    return timeline
 
-    if video.intro:
-        intro = VideoFileClip(video.intro.file.path)
-        final_video = concatenate_videoclips([intro, final_video], method='compose')
 
-    if video.outro:
-        outro = VideoFileClip(video.outro.file.path)
-        final_video = concatenate_videoclips([final_video, outro], method='compose')
+def resume_audio_tracks(timeline: dict, manifest: RenderManifest) -> dict:
+    """
+    Write the audio tracks of a timeline, unless the render manifest has them for the same dialogue and music.
 
-    final_video.write_videofile(rf"{video.dir_name}\output_video.mp4", fps = 24, threads = 8)
+    Parameters:
+    -----------
+    timeline : dict
+        The timeline of the video.
+    manifest : RenderManifest
+        The render manifest of the video.
 
-    for sound in sound_list:
-        sound.close()
+    Returns:
+    --------
+    dict
+        The timeline, with the 'mix' of the written or resumed tracks.
+    """
 
-    for vid in vids:
-        vid.close()
+    music = timeline["music"]
+    key = fingerprint({
+        "scenes": [{"audio": file_hash(x["audio"]), "start": round(x["start"], 3)} for x in timeline["scenes"]],
+        "duration": round(timeline["duration"], 3),
+        "music": {**music, "file": file_hash(music["file"])} if music else None,
+    })
 
-    video.output = rf"{video.dir_name}\output_video.mp4"
+    if manifest.done("audio", key):
+        timeline["mix"] = manifest.outputs("audio")[-1]
+        return timeline
+
+    write_audio_tracks(timeline)
+    manifest.save("audio", key, [timeline["audio"], timeline["mix"]])
+    return timeline
+
+
+def resume_avatar_video(video: Videos, timeline: dict, manifest: RenderManifest) -> str:
+    """
+    Create the avatar video of a video, unless the render manifest has it for the same avatar and dialogue.
+
+    Parameters:
+    -----------
+    video : Videos
+        The video being rendered.
+    timeline : dict
+        The timeline of the video, with its dialogue track written.
+    manifest : RenderManifest
+        The render manifest of the video.
+
+    Returns:
+    --------
+    str
+        The path of the avatar video.
+
+    Notes:
+    ------
+    - SadTalker is the slowest stage of a render, so a render retried after a worker died skips it.
+    - The avatar is created again when the dialogue changes, since its lips follow it.
+    """
+
+    key = fingerprint({"avatar": file_hash(video.avatar.file.path), "audio": file_hash(timeline["audio"]),
+                       "scale": AVATAR_SCALE, "video": video_codec_args()})
+
+    if manifest.done("avatar", key):
+        return manifest.outputs("avatar")[0]
+
+    with StageProfiler("avatar", video = video):
+        output = create_avatar_video(video.avatar, video.dir_name, video_id = video.id)
+
+    manifest.save("avatar", key, [output])
+    return output
+
+
+def mezzanine_file(bumper: Union[Intro, Outro], profile: dict = None) -> str:
+    """
+    Return the mezzanine file of an intro or outro, transcoding it the first time it is needed.
+
+    Parameters:
+    -----------
+    bumper : Union[Intro, Outro]
+        The intro or outro.
+    profile : dict, optional
+        The render profile of the segments it is joined with. Default is the "final" profile.
+
+    Returns:
+    --------
+    str
+        The path of the clip transcoded to the codec, size, frame rate and audio rate of the rendered segments.
+
+    Notes:
+    ------
+    - The mezzanine is named after a key of the clip file and of the encoder arguments, so it is transcoded once
+      for every video that uses it, and again only if the file or the render profile changes.
+    - The mezzanines of every profile are kept side by side in the mezzanine folder and are not tracked by a
+      model field, so videos with different encoder profiles do not transcode the intro or outro again in turns,
+      and no mezzanine is deleted while a render that resolved it may still join it.
+    """
+
+    key = fingerprint({"file": file_hash(bumper.file.path), "video": video_codec_args(profile),
+                       "audio": AUDIO_CODEC_ARGS, "size": OUTPUT_SIZE})
+
+    folder = os.path.dirname(bumper.file.path) + "/mezzanine"
+    output = f"{folder}/{key}.mp4"
+    if not os.path.exists(output):
+        os.makedirs(folder, exist_ok = True)
+        temp = f"{folder}/{key}.{uuid.uuid4().hex}.tmp.mp4"
+        normalize_clip(bumper.file.path, temp, profile = profile)
+        os.replace(temp, output)
+
+    return output
+
+
+def make_video_ffmpeg(video: Videos, subtitle: bool = False, renditions: list = None) -> Videos:
+    """
+    Render the video with a single ffmpeg filter graph instead of moviepy.
+
+    Parameters:
+    -----------
+    video : Videos
+        The video to render.
+    subtitle : bool, optional
+        A flag indicating whether to include subtitles in the video. Default is False.
+    renditions : list, optional
+        The names of the extra renditions to write, like "720p". Default is the RENDER_RENDITIONS setting.
+
+    Returns:
+    --------
+    Videos
+        The updated video instance with the output video file path and status set to "COMPLETED".
+
+    Detailed Steps:
+    ---------------
+    1. Prepare the timeline of the video, with its dialogue track and avatar video.
+    2. Render the timeline to output_video.mp4 with one ffmpeg process, or scene by scene when the
+       RENDER_SEGMENTS setting is on.
+    3. Encode the extra renditions, in the same process as the output when it is rendered with one process, or
+       from the joined segments otherwise.
+
+    Notes:
+    ------
+    - The output matches the moviepy backend, but no frame goes through python.
+    - The encoding and renditions stages are profiled and the profiles saved on the video.
+    - Segmented renders trade the single pass for the scene cache : their renditions decode the joined output
+      once more. Set RENDER_SEGMENTS to false in the .env file to encode them with the output.
+    """
+
+    timeline = prepare_timeline(video, subtitle = subtitle)
+    output = f"{video.dir_name}/output_video.mp4"
+    outputs = rendition_outputs(video, renditions)
+    if settings.RENDER_SEGMENTS:
+        with StageProfiler("encoding", video = video):
+            render_segments(video, timeline, output)
+
+        if outputs:
+            with StageProfiler("renditions", video = video):
+                transcode_renditions(output, outputs, profile = timeline["encoder"])
+
+    else:
+        progress = Progress(video.id, "encoding", total_frames = timeline_frames(timeline)).start()
+        with StageProfiler("encoding", video = video):
+            render_timeline(timeline, output, f"{video.dir_name}/filter_graph.txt", renditions = outputs,
+                            on_progress = progress.encoded)
+        progress.finish()
+
+    save_renditions(video, outputs)
+
+    video.output = output
     video.status = "COMPLETED"
     video.save()
+    Progress(video.id, "completed").start()
     return video
 
 
-def create_avatar_video(avatar: Avatars, dir_name: str) -> str:
+def timeline_frames(timeline: dict) -> int:
+    """
+    Return the number of frames of the rendered timeline, intro and outro included.
+    """
+
+    bumpers = sum(probe_video_duration(timeline[x]) for x in ("intro", "outro") if timeline[x])
+    return round((timeline["duration"] + bumpers) * OUTPUT_FPS)
+
+
+def rendition_outputs(video: Videos, renditions: list = None) -> list:
+    """
+    Return the size and output path of every requested rendition that is smaller than the output video.
+
+    Parameters:
+    -----------
+    video : Videos
+        The video being rendered.
+    renditions : list, optional
+        The names of the renditions, like "720p". Default is the RENDER_RENDITIONS setting.
+
+    Returns:
+    --------
+    list
+        The renditions, each one with the 'name', 'size' and 'output' keys.
+    """
+
+    renditions = settings.RENDER_RENDITIONS if renditions is None else renditions
+    return [{"name": name, "size": RENDITIONS[name], "output": f"{video.dir_name}/output_{name}.mp4"}
+            for name in renditions if name in RENDITIONS and RENDITIONS[name] != OUTPUT_SIZE]
+
+
+def save_renditions(video: Videos, outputs: list) -> None:
+    """
+    Store the rendered renditions on the video and delete the ones that were not rendered this time.
+    """
+
+    for item in outputs:
+        VideoRendition.objects.update_or_create(video = video, name = item["name"],
+                                                defaults = {"file": item["output"], "width": item["size"][0],
+                                                            "height": item["size"][1]})
+
+    VideoRendition.objects.filter(video = video).exclude(name__in = [x["name"] for x in outputs]).delete()
+
+
+def make_preview(video: Videos, subtitle: bool = False) -> Videos:
+    """
+    Render a low resolution, low frame rate preview of the video to check its timing and layout.
+
+    Parameters:
+    -----------
+    video : Videos
+        The video to preview.
+    subtitle : bool, optional
+        A flag indicating whether to include subtitles in the preview. Default is False.
+
+    Returns:
+    --------
+    Videos
+        The video instance with the preview file path set.
+
+    Notes:
+    ------
+    - The preview has the same timeline as the final video (scene order, fades, background, avatar, intro and
+      outro) and is rendered with the "preview" profile to preview_video.mp4, so the output and the status of
+      the video are not touched.
+    - The avatar is only shown if its video was already created, creating it would take longer than the preview.
+    """
+
+    timeline = collect_timeline(video, subtitle = subtitle)
+    resume_audio_tracks(timeline, RenderManifest(video.dir_name))
+
+    avatar_video = avatar_video_path(video.dir_name)
+    if video.avatar and os.path.exists(avatar_video):
+        timeline["avatar"] = avatar_video
+
+    preview = f"{video.dir_name}/preview_video.mp4"
+    render_timeline(timeline, preview, f"{video.dir_name}/preview_graph.txt", profile = RENDER_PROFILES["preview"])
+
+    video.preview = preview
+    video.save(update_fields = ["preview"])
+    return video
+
+
+def segment_key(timeline: dict, scene: dict) -> str:
+    """
+    Calculate the cache key of a scene segment from everything that changes its frames.
+
+    Parameters:
+    -----------
+    timeline : dict
+        The timeline of the video.
+    scene : dict
+        The timeline scene of the segment.
+
+    Returns:
+    --------
+    str
+        The fingerprint of the segment inputs.
+
+    Notes:
+    ------
+    - The key covers the dialogue, the scene images, the background, the fades, the subtitle text and the
+      encoder profile.
+    - The position of the scene only matters when there is an avatar, since the segment shows that part of it.
+    """
+
+    start = scene["start"]
+    end = start + scene["duration"]
+    background = timeline["background"]
+    return fingerprint({
+        "audio": file_hash(scene["audio"]),
+        "frames": round(end * OUTPUT_FPS) - round(start * OUTPUT_FPS),
+        "slots": [{"type": x["type"], "duration": round(x["duration"], 3),
+                   "file": file_hash(x["file"]) if x["file"] else None} for x in scene["slots"]],
+        "background": {**background, "file": file_hash(background["file"])} if background else None,
+        "fade_in": start == 0,
+        "fade_out": end >= timeline["duration"] - 0.001,
+        "encoder": timeline["encoder"],
+        "avatar": {"file": file_hash(timeline["avatar"]), "start": round(start, 3)} if timeline["avatar"] else None,
+        "subtitle": scene["text"] if timeline["subtitles"] else None,
+    })
+
+
+def cache_segment(timeline: dict, scene: dict, segment: str, threads: int = 0) -> str:
+    """
+    Render a scene segment to a temporary file and move it to its cache path once it is complete.
+    """
+
+    render_segment(timeline, scene, f"{segment[:-4]}.tmp.mp4", f"{segment[:-4]}.txt", threads = threads)
+    os.replace(f"{segment[:-4]}.tmp.mp4", segment)
+    return segment
+
+
+def render_scene_segments(timeline: dict, scenes: list, folder: str, workers: int = None,
+                          on_segment: Callable = None, progress: Progress = None) -> list:
+    """
+    Render the segments of the given scenes that are not cached yet.
+
+    Parameters:
+    -----------
+    timeline : dict
+        The timeline of the video.
+    scenes : list
+        The timeline scenes to render.
+    folder : str
+        The folder the segments are cached in.
+    workers : int, optional
+        The number of segments encoded at the same time. Default is the RENDER_WORKERS setting.
+    on_segment : Callable, optional
+        Called with the scene and the segment path as soon as a segment and all the ones before it are ready.
+    progress : Progress, optional
+        Updated with the scene index and the frames of the timeline done, every time on_segment would be called.
+
+    Returns:
+    --------
+    list
+        The paths of the segments of the scenes, in timeline order.
+
+    Notes:
+    ------
+    - Up to workers ffmpeg processes run at a time, each one with its share of the cpu cores.
+    - The returned order does not depend on the order the segments finish in, so the output does not depend on
+      the number of workers.
+    - Segments are moved to their cache path only once they are complete, so a render retried after a worker died
+      resumes from the segments it already finished.
+    """
+
+    os.makedirs(folder, exist_ok = True)
+
+    workers = workers or settings.RENDER_WORKERS
+    threads = max(1, (os.cpu_count() or 1) // workers) if workers > 1 else 0
+
+    segments = [f"{folder}/{segment_key(timeline, scene)}.mp4" for scene in scenes]
+    missing = {segment: scene for segment, scene in zip(segments, scenes) if not os.path.exists(segment)}
+
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        jobs = {segment: pool.submit(cache_segment, timeline, scene, segment, threads)
+                for segment, scene in missing.items()}
+
+        for index, (segment, scene) in enumerate(zip(segments, scenes)):
+            if segment in jobs:
+                jobs[segment].result()
+
+            if on_segment:
+                on_segment(scene, segment)
+
+            if progress:
+                progress.update(scene = index, frames = round((scene["start"] + scene["duration"]) * OUTPUT_FPS))
+
+    return segments
+
+
+def join_scene_segments(timeline: dict, segments: list, folder: str, output: str) -> str:
+    """
+    Join rendered scene segments, with the mezzanine intro and outro, into the output video.
+
+    Parameters:
+    -----------
+    timeline : dict
+        The timeline of the video.
+    segments : list
+        The paths of all the scene segments, in timeline order.
+    folder : str
+        The folder the segments are cached in.
+    output : str
+        The path of the mp4 file to write.
+
+    Returns:
+    --------
+    str
+        The path of the joined video.
+
+    Notes:
+    ------
+    - The intro and outro are joined from their mezzanine files, prepared by prepare_timeline.
+    - Segments that are no longer part of the video are deleted from the folder.
+    """
+
+    bumpers = timeline["mezzanines"]
+    join_segments(timeline, segments, output, intro = bumpers.get("intro"), outro = bumpers.get("outro"))
+
+    used = {os.path.basename(x) for x in segments}
+    for file in os.listdir(folder):
+        if file not in used:
+            os.remove(f"{folder}/{file}")
+
+    return output
+
+
+def render_segments(video: Videos, timeline: dict, output: str, workers: int = None, hls: bool = None) -> str:
+    """
+    Render every scene of the timeline into its own cached segment and join them into the output video.
+
+    Parameters:
+    -----------
+    video : Videos
+        The video being rendered.
+    timeline : dict
+        The timeline of the video.
+    output : str
+        The path of the mp4 file to write.
+    workers : int, optional
+        The number of segments encoded at the same time. Default is the RENDER_WORKERS setting.
+    hls : bool, optional
+        A flag indicating whether to publish every segment to the hls playlist of the video as soon as it is
+        ready. Default is the RENDER_HLS setting.
+
+    Returns:
+    --------
+    str
+        The path of the joined video.
+
+    Notes:
+    ------
+    - Segments are cached in the segments folder of the video under a key of their inputs, so after editing a
+      single scene only that scene is encoded again.
+    - The segments are joined by stream copy, only the dialogue and music are encoded again.
+    - The progress is reported once per scene, in timeline order.
+    """
+
+    folder = f"{video.dir_name}/segments"
+    hls = settings.RENDER_HLS if hls is None else hls
+    progress = Progress(video.id, "encoding", scenes = len(timeline["scenes"]),
+                        total_frames = round(timeline["duration"] * OUTPUT_FPS)).start()
+    if not hls:
+        segments = render_scene_segments(timeline, timeline["scenes"], folder, workers = workers,
+                                         progress = progress)
+        return join_scene_segments(timeline, segments, folder, output)
+
+    playlist = HlsPlaylist(f"{video.dir_name}/hls", timeline)
+    bumpers = timeline["mezzanines"]
+    if "intro" in bumpers:
+        playlist.add_clip(bumpers["intro"])
+
+    segments = render_scene_segments(timeline, timeline["scenes"], folder, workers = workers,
+                                     on_segment = playlist.add_scene, progress = progress)
+    join_scene_segments(timeline, segments, folder, output)
+
+    if "outro" in bumpers:
+        playlist.add_clip(bumpers["outro"])
+
+    playlist.finish()
+    return output
+
+
+def split_shards(scenes: list, shards: int) -> list:
+    """
+    Split the timeline scenes into consecutive ranges of about the same duration.
+
+    Parameters:
+    -----------
+    scenes : list
+        The timeline scenes.
+    shards : int
+        The maximum number of ranges.
+
+    Returns:
+    --------
+    list
+        The (first, last) scene index ranges, last excluded, in timeline order.
+    """
+
+    total = sum(scene["duration"] for scene in scenes)
+    ranges = []
+    first = 0
+    elapsed = 0
+    for index, scene in enumerate(scenes):
+        elapsed += scene["duration"]
+        if elapsed >= total * (len(ranges) + 1) / shards and index + 1 < len(scenes):
+            ranges.append((first, index + 1))
+            first = index + 1
+
+    ranges.append((first, len(scenes)))
+    return ranges
+
+
+def avatar_video_path(dir_name: str) -> str:
+    """
+    Return the path of the avatar overlay track of a video directory.
+    """
+
+    return rf'{os.getcwd()}\{dir_name}\avatar_overlay.mp4'
+
+
+def create_avatar_video(avatar: Avatars, dir_name: str, video_id: int = None) -> str:
     """
     Create an avatar video synchronized with an audio file.
 
@@ -231,6 +1004,8 @@ def create_avatar_video(avatar: Avatars, dir_name: str) -> str:
         An instance of the Avatars class containing the avatar image file.
     dir_name : str
         The directory name where the output files are stored.
+    video_id : int, optional
+        The id of the video the avatar is created for, its progress is sent to the websocket group of the video.
 
     Returns:
     --------
@@ -240,25 +1015,35 @@ def create_avatar_video(avatar: Avatars, dir_name: str) -> str:
     Detailed Steps:
     ---------------
     1. Use the `lip` function to generate a video of the avatar synchronized with the audio file.
-    2. Use ffmpeg to encode the generated video with the h264 codec and save it to the specified directory.
+    2. Use ffmpeg to scale the generated video to its overlay size and encode it, without audio, at the output
+       frame rate, in the same pass.
 
     Notes:
     ------
     - Requires the `lip` function and ffmpeg to be properly installed and configured.
     - The `lip` function should generate the avatar video and save it in the specified directory.
+    - The track is ready to overlay at the top right corner of the output as it is, so the compositors do not
+      scale or convert its frames. The avatar is opaque, so it needs no alpha channel.
+    - Keyframes every second keep the seeks of the segmented renders into the track cheap.
+    - The track is written to a temporary file first, so a render killed while encoding it leaves no partial
+      avatar video.
     """
+    progress = Progress(video_id, "avatar").start()
     avatar_cam = lip(source_image = avatar.file.path,
                      driven_audio = rf"{dir_name}\output_audio.wav",
                      result_dir = dir_name, facerender = "pirender", )
 
-    output = rf'{os.getcwd()}\{dir_name}\output_avatar.mp4'
-    subprocess.run(shlex.split(
-        f'ffmpeg -i "{os.getcwd()}/{avatar_cam}" -vcodec h264  "{output}"'))
+    output = avatar_video_path(dir_name)
+    run_ffmpeg(['-i', f'{os.getcwd()}/{avatar_cam}', '-vf',
+                f'scale=trunc(iw*{AVATAR_SCALE / 2})*2:trunc(ih*{AVATAR_SCALE / 2})*2,setsar=1,format=yuv420p',
+                *video_codec_args(), '-g', OUTPUT_FPS, '-an', f'{output[:-4]}.tmp.mp4'])
+    os.replace(f'{output[:-4]}.tmp.mp4', output)
 
+    progress.finish()
     return output
 
 
-def split_video_and_mp3(video_path: str) -> tuple[str, str]:
+def split_video_and_mp3(video_path: str) -> tuple[Union[str, None], str]:
     """
     Split a video file into separate video and audio files.
 
@@ -269,39 +1054,144 @@ def split_video_and_mp3(video_path: str) -> tuple[str, str]:
 
     Returns:
     --------
-    tuple[str, str]
-        A tuple containing the file paths to the saved audio (mp3) and video (mp4) files.
+    tuple[Union[str, None], str]
+        A tuple containing the file paths to the saved audio and video (mp4) files. The audio is None if the video
+        has no audio stream.
 
     Detailed Steps:
     ---------------
-    1. Determine the folder to save the new audio and video files.
-    2. Load the video file using VideoFileClip.
-    3. Generate unique file names for the audio and video files.
-    4. Extract and save the audio from the video as an mp3 file.
-    5. Remove the audio from the video and save the new video file.
-    6. Remove the original video file.
-    7. Return the paths to the saved audio and video files.
+    1. Determine the folder to save the new audio and video files, and probe the codecs of the original video.
+    2. Copy the video stream to an mp4 without the audio, if the mp4 container supports its codec.
+    3. Copy the audio stream to an mp3 or m4a file, if it is mp3 or aac.
+    4. Transcode the streams that could not be copied, or whose copy failed, to h264 and mp3.
+    5. Remove the original video file.
+    6. Return the paths to the saved audio and video files.
 
     Notes:
     ------
-    - Requires the moviepy library.
+    - Uploads are usually h264 and aac, so splitting them only rewrites the container and takes a few seconds.
     - The function assumes the existence of 'dialogues' and 'images' directories within the folder of the original video file.
     - The original video file is deleted after processing.
     """
 
     folder_to_save = os.path.split(os.path.abspath(video_path))[0]
-    video = VideoFileClip(video_path)
-    audio_save = f'{str(folder_to_save)}/dialogues/{str(uuid.uuid4())}.mp3'
-    video_save = f'{str(folder_to_save)}/images/{str(uuid.uuid4())}.mp4'
+    streams = probe(video_path)["streams"]
+    video_codec = next(x["codec_name"] for x in streams if x["codec_type"] == "video")
+    audio_codec = next((x["codec_name"] for x in streams if x["codec_type"] == "audio"), None)
 
-    video.audio.write_audiofile(audio_save)
+    video_save = f'{str(folder_to_save)}/images/{str(uuid.uuid4())}.mp4'
+    video_copy = ['-c:v', 'copy'] if video_codec in MP4_VIDEO_CODECS else None
+    demux_stream(video_path, video_save, ['-map', '0:v:0', '-an', '-sn', '-dn'], video_copy,
+                 video_codec_args(vfr = True))
+
+    audio_save = None
+    if audio_codec:
+        extension = AUDIO_COPY_FORMATS.get(audio_codec, "mp3")
+        audio_save = f'{str(folder_to_save)}/dialogues/{str(uuid.uuid4())}.{extension}'
+        audio_copy = ['-c:a', 'copy'] if audio_codec in AUDIO_COPY_FORMATS else None
+        audio_transcode = ['-c:a', 'aac', '-b:a', '192k'] if extension == "m4a" else ['-c:a', 'libmp3lame', '-q:a', 2]
+        demux_stream(video_path, audio_save, ['-map', '0:a:0', '-vn', '-sn', '-dn'], audio_copy, audio_transcode)
 
-    video_without_audio = video.set_audio(None)
-    video_without_audio.write_videofile(video_save)
     os.remove(video_path)
     return audio_save, video_save
 
 
+def demux_stream(path: str, output: str, select: list, copy: Union[list, None], transcode: list) -> str:
+    """
+    Write one stream of a media file to its own file, copied if possible or else transcoded.
+
+    Parameters:
+    -----------
+    path : str
+        The path of the media file.
+    output : str
+        The path of the new file.
+    select : list
+        The ffmpeg arguments that select the stream and drop the others.
+    copy : list or None
+        The stream copy arguments, None if the codec cannot be copied to the output container.
+    transcode : list
+        The encoder arguments used when the stream cannot be copied.
+
+    Returns:
+    --------
+    str
+        The path of the new file.
+    """
+
+    if copy:
+        try:
+            run_ffmpeg(['-i', path, *select, *copy, output])
+            return output
+        except subprocess.CalledProcessError:
+            logger.warning(f"Could not copy the stream of {path} to {output}, transcoding it")
+
+    run_ffmpeg(['-i', path, *select, *transcode, output])
+    return output
+
+
+def write_overlay_texts(overlays: list, folder: str) -> list:
+    """
+    Write the text of every overlay to its own file and set it as the 'textfile' of the overlay.
+    """
+
+    if overlays:
+        os.makedirs(folder, exist_ok = True)
+
+    for overlay in overlays:
+        overlay["textfile"] = f"{folder}/{uuid.uuid4()}.txt"
+        with open(overlay["textfile"], "w", encoding = "utf-8") as file:
+            file.write(overlay["text"])
+
+    return overlays
+
+
+def add_texts_to_video(video: str, overlays: list) -> str:
+    """
+    Draw several texts over a video in a single encode and return the new video file path.
+
+    Parameters:
+    -----------
+    video : str
+        The file path to the original video.
+    overlays : list
+        The text overlays, each one with its 'text' and optionally its 'fontsize', 'fontcolor', 'x' and 'y' and
+        the 'start' and 'end' seconds it is shown between. The defaults are those of TEXT_OVERLAY.
+
+    Returns:
+    --------
+    str
+        The file path to the new video with the added texts.
+
+    Detailed Steps:
+    ---------------
+    1. Write the text of every overlay to a text file.
+    2. Chain a drawtext filter per overlay and encode the video once, copying its audio.
+    3. Remove the text files and the original video file.
+    4. Return the file path to the new video.
+
+    Notes:
+    ------
+    - Adding N texts costs one encode instead of N.
+    - The texts are read from files by drawtext, so they need no quoting.
+    - The original video file is deleted after the new video is created.
+    """
+
+    video_name = video[:-3]+"l.mp4"
+    overlays = write_overlay_texts([{**TEXT_OVERLAY, **overlay} for overlay in overlays],
+                                   os.path.split(os.path.abspath(video))[0])
+
+    try:
+        run_ffmpeg(['-i', video, '-vf', ','.join(drawtext_filters(overlays)), *video_codec_args(vfr = True),
+                    '-c:a', 'copy', video_name])
+    finally:
+        for overlay in overlays:
+            os.remove(overlay["textfile"])
+
+    os.remove(video)
+    return video_name
+
+
 def add_text_to_video(video: str, text: str, fontcolor: str = "blue", fontsize: int = 50,
                       x: int = 500, y: int = 500) -> str:
     """
@@ -327,24 +1217,10 @@ def add_text_to_video(video: str, text: str, fontcolor: str = "blue", fontsize:
     str
         The file path to the new video with the added text.
 
-    Detailed Steps:
-    ---------------
-    1. Generate a new file name for the video with the added text.
-    2. Construct the ffmpeg command to add text to the video.
-    3. Execute the ffmpeg command.
-    4. Remove the original video file.
-    5. Return the file path to the new video.
-
     Notes:
     ------
-    - Requires ffmpeg to be installed and available in the system path.
+    - Use add_texts_to_video to add several texts in one encode.
     - The original video file is deleted after the new video is created.
     """
 
-    video_name = video[:-3]+"l.mp4"
-    command = f"ffmpeg -i \"{video}\" -vf \" drawtext =fontsize={fontsize}: fontcolor = {fontcolor}:text='{text}': " \
-              f"x = {x}: y= {y} \" \"{video_name}\""
-
-    os.system(command)
-    os.remove(video)
-    return video_name
+    return add_texts_to_video(video, [{"text": text, "fontcolor": fontcolor, "fontsize": fontsize, "x": x, "y": y}])
@@ -3,18 +3,40 @@ from rest_framework import viewsets
 from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from rest_framework import status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view
+from django.http import FileResponse, Http404
 from drf_yasg.utils import swagger_auto_schema
+from drf_yasg import openapi
 from ..paginator import StandardResultsSetPagination
 from ..serializers import VideoSerializer, VideoNestedSerializer
 from ..models import Videos
-from ..utils.video_utils import make_video
-from ..services.VideoServices import video_update, video_regenerate
+from ..utils.exceptions import RenderInProgressError, InvalidEncoderProfileError
+from ..utils.ffmpeg_utils import RENDITIONS
+from ..services.VideoServices import video_update, video_regenerate, video_render_async, video_render_status, \
+    video_preview, video_plan
 import logging
+import os
+import re
 
 
 logger = logging.getLogger(__name__)
 
+RENDER_BACKENDS = ("moviepy", "ffmpeg", "distributed")
+
+backend = openapi.Parameter('backend', openapi.IN_QUERY, description="Render backend, moviepy, ffmpeg or "
+                                                                    "distributed. Defaults to the RENDER_BACKEND "
+                                                                    "setting.",
+                            type=openapi.TYPE_STRING, enum=list(RENDER_BACKENDS))
+
+renditions = openapi.Parameter('renditions', openapi.IN_QUERY, description="Comma separated extra renditions of the "
+                                                                          "output, like 720p,480p. Defaults to the "
+                                                                          "RENDER_RENDITIONS setting.",
+                               type=openapi.TYPE_STRING)
+
+subtitle = openapi.Parameter('subtitle', openapi.IN_QUERY, description="Plan the subtitle track too. Defaults to "
+                                                                      "false.",
+                             type=openapi.TYPE_BOOLEAN)
+
 
 class VideoView(viewsets.ModelViewSet):
     serializer_class = VideoSerializer
@@ -30,14 +52,20 @@ class VideoView(viewsets.ModelViewSet):
     @swagger_auto_schema(request_body = VideoSerializer,
                          operation_description = "This API updates the attributes of the video. If you add a new avatar"
                                                  " it will delete previous audio files and will regenerate them with "
-                                                 "new audios")
+                                                 "new audios. The encoder_profile is auto, standard, slides or motion,"
+                                                 " or no_value to use the one of the template")
     def partial_update(self, request, pk):
         avatar = request.data.get('avatar')
         intro = request.data.get('intro')
         outro = request.data.get('outro')
+        encoder_profile = request.data.get('encoder_profile')
         video = self.get_object()
 
-        outcome = video_update(video, avatar, intro, outro)
+        try:
+            outcome = video_update(video, avatar, intro, outro, encoder_profile = encoder_profile)
+        except InvalidEncoderProfileError as ex:
+            return Response({"message": ex.message}, status = status.HTTP_400_BAD_REQUEST)
+
         logger.info(f"Video with id {pk}  got updated successfully")
         return Response({"message": "Updated Success",
                          "video": self.get_serializer_class()(outcome).data})
@@ -58,12 +86,74 @@ class VideoView(viewsets.ModelViewSet):
 
         return Response({"Message": f"Video with id {pk} got regenerated successfully"}, status = status.HTTP_200_OK)
 
-    @swagger_auto_schema(operation_description = "This api renders the video, you will have to put a query param in url"
-                                                 " video_id with the video you wanna render", method = "GET")
+    @swagger_auto_schema(operation_description = "This api queues the render of the video on the celery workers. Poll "
+                                                 "render_status to know when it is completed. It returns 409 with the "
+                                                 "running task id if the video is already queued or rendering",
+                         method = "GET",
+                         manual_parameters = [backend, renditions])
+    @action(detail = True, methods = ["GET"])
+    def render_video(self, request, pk):
+        vid = get_object_or_404(Videos, id = pk)
+        selected = request.GET.get("renditions")
+        render_backend = request.GET.get("backend")
+        if render_backend is not None and render_backend not in RENDER_BACKENDS:
+            return Response({"message": f"Unknown render backend {render_backend}, use one of : "
+                                        f"{', '.join(RENDER_BACKENDS)}"}, status = status.HTTP_400_BAD_REQUEST)
+
+        selected = [x for x in selected.split(",") if x] if selected is not None else None
+        unknown = [x for x in selected or [] if x not in RENDITIONS]
+        if unknown:
+            return Response({"message": f"Unknown renditions {', '.join(unknown)}, use some of : "
+                                        f"{', '.join(RENDITIONS)}"}, status = status.HTTP_400_BAD_REQUEST)
+
+        try:
+            task_id = video_render_async(vid, backend = render_backend, renditions = selected)
+        except RenderInProgressError as ex:
+            return Response({"message": ex.message, "task_id": ex.task_id}, status = status.HTTP_409_CONFLICT)
+
+        return Response({"message": "The video has been queued for rendering", "task_id": task_id,
+                         "result": VideoSerializer(vid).data}, status = status.HTTP_202_ACCEPTED)
+
+    @swagger_auto_schema(operation_description = "This api returns the render status of the video : queued, running, "
+                                                 "completed or failed", method = "GET")
+    @action(detail = True, methods = ["GET"])
+    def render_status(self, _, pk):
+        vid = get_object_or_404(Videos, id = pk)
+        return Response(video_render_status(vid))
+
+    @swagger_auto_schema(operation_description = "This api renders a low resolution preview of the video, to check "
+                                                 "its timing and layout. The rendered video is not changed",
+                         method = "GET")
+    @action(detail = True, methods = ["GET"])
+    def preview(self, _, pk):
+        vid = get_object_or_404(Videos, id = pk)
+        result = video_preview(vid)
+        return Response({"message": "The preview has been made successfully", "result": VideoSerializer(result).data})
+
+    @swagger_auto_schema(operation_description = "This api returns the timeline the video is rendered from : the "
+                                                 "start and end of every scene, its image slots and fades, the "
+                                                 "music window and the avatar and subtitle tracks. Nothing is "
+                                                 "rendered", method = "GET", manual_parameters = [subtitle])
     @action(detail = True, methods = ["GET"])
-    def render_video(self, _, pk):
-        vid = Videos.objects.get(id = pk)
-        vid.status = "RENDERING"
-        vid.save()
-        result = make_video(vid)
-        return Response({"message": "The video has been made successfully", "result": VideoSerializer(result).data})
+    def plan(self, request, pk):
+        vid = get_object_or_404(Videos, id = pk)
+        return Response(video_plan(vid, subtitle = request.GET.get("subtitle", "false").lower() == "true"))
+
+
+@swagger_auto_schema(operation_description = "This api serves the hls playlist (index.m3u8) and segments of a video. "
+                                             "The playlist grows while the video is RENDERING, so it can be played "
+                                             "before the render finishes", method = "GET")
+@api_view(['GET'])
+def hls_file(_, pk, name):
+    if not re.fullmatch(r"index\.m3u8|\d+\.ts", name):
+        raise Http404
+
+    video = get_object_or_404(Videos, id = pk)
+    path = f"{video.dir_name}/hls/{name}"
+    if not os.path.exists(path):
+        raise Http404
+
+    content_type = "application/vnd.apple.mpegurl" if name.endswith(".m3u8") else "video/mp2t"
+    response = FileResponse(open(path, "rb"), content_type = content_type)
+    response["Cache-Control"] = "no-cache" if name.endswith(".m3u8") else "max-age=3600"
+    return response
@@ -98,6 +98,14 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'video_creator.wsgi.application'
+ASGI_APPLICATION = 'video_creator.asgi.application'
+
+CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "CONFIG": {"hosts": [os.getenv("CHANNEL_LAYER_URL", "redis://127.0.0.1:6379")]},
+    },
+}
 
 
 # Database
@@ -164,6 +172,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 CELERY_BROKER_URL = "redis://127.0.0.1:6379"
+CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://127.0.0.1:6379")
+# Seconds redis waits for a task to be acknowledged before it delivers it again, longer than the longest render
+CELERY_BROKER_TRANSPORT_OPTIONS = {"visibility_timeout": int(os.getenv("CELERY_VISIBILITY_TIMEOUT", 12 * 3600))}
 
 AUTHENTICATION_BACKENDS = [
 
@@ -221,3 +232,20 @@ VISION_SELECTION = False
 
 
 CONFIG_PATH = "apps/videomanagement/utils/SadTalker/src/config"
+
+RENDER_BACKEND = os.getenv("RENDER_BACKEND", "moviepy")  # Render backend : moviepy, ffmpeg or distributed
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+FFPROBE_BINARY = os.getenv("FFPROBE_BINARY", "ffprobe")
+# Render every scene to its own cached segment, so re-renders only encode edited scenes. false renders the video and
+# its renditions in a single ffmpeg pass instead
+RENDER_SEGMENTS = os.getenv("RENDER_SEGMENTS", "true").lower() == "true"
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", 1))  # Number of scene segments encoded at the same time
+RENDER_SHARDS = int(os.getenv("RENDER_SHARDS", 4))  # Number of celery tasks a distributed render is split into
+RENDER_HLS = False  # Publish segmented renders as an hls playlist while they render, at /api/video/<id>/hls/index.m3u8
+RENDER_MEMORY_CAP = int(os.getenv("RENDER_MEMORY_CAP", 512 * 1024 ** 2))  # Bytes of scene sources moviepy keeps open
+RENDER_RENDITIONS = [x for x in os.getenv("RENDER_RENDITIONS", "").split(",") if x]  # Extra outputs : 720p,480p
+RENDER_ENCODER_PROFILE = os.getenv("RENDER_ENCODER_PROFILE", "auto")  # auto, standard, slides or motion
+MUSIC_LOUDNESS = float(os.getenv("MUSIC_LOUDNESS", -37))  # LUFS the background music is normalized to
+IMAGE_CACHE_DIR = "media/cache/images"  # Resized copies of the scene images, shared by every video
+IMAGE_CACHE_MAX_SIZE = int(os.getenv("IMAGE_CACHE_MAX_SIZE", 2 * 1024 ** 3))  # Bytes, least recently used go first
+IMAGE_CACHE_MIN_AGE = int(os.getenv("IMAGE_CACHE_MIN_AGE", 24 * 3600))  # Seconds cached images are kept after use